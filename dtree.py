@@ -1,5 +1,13 @@
+import os
 import sys
+import math
+import heapq
+import struct
 import random
+import tempfile
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
 import numpy as np
 from collections import Counter
 
@@ -15,9 +23,13 @@ Here are the links:
 '''
 
 class TreeNode:
-    def __init__(self, feature=None, threshold=None, left_child=None, right_child=None, is_leaf=False, class_label=None):
+    def __init__(self, feature=None, threshold=None, left_child=None, right_child=None, is_leaf=False, class_label=None,
+                 samples=0, errors=0):
         '''
-        Initializing the Tree Node attributes
+        Initializing the Tree Node attributes. Every node also keeps how many
+        training examples reached it and how many of them its most common 
+        label gets wrong, which is its class_label for an inner node too, so
+        pruning can turn it into a leaf
         '''
         self.feature = feature
         self.threshold = threshold
@@ -25,168 +37,786 @@ class TreeNode:
         self.right_child = right_child
         self.is_leaf = is_leaf
         self.class_label = class_label
+        self.samples = samples
+        self.errors = errors
+
+class FlatTree:
+    def __init__(self, feature, threshold, left, right, value):
+        '''
+        A tree compiled into parallel arrays, node 0 being the root. An inner
+        node splits on feature at threshold and sends its rows to the nodes
+        left and right, the right child always numbered right after the left,
+        and a leaf has feature -1 and holds its label in value. For routing, a
+        leaf is made to point at itself with a threshold no value is at or 
+        below, so rows that reach it stay there
+        '''
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.leaf = feature < 0
+        self.route_feature = np.where(self.leaf, 0, feature)
+        self.route_threshold = np.where(self.leaf, np.nan, threshold)
+        self.route_right = np.where(self.leaf, np.arange(len(feature), dtype=np.int32), right)
+        depth = np.zeros(len(feature), dtype=np.int32)
+        for node in np.nonzero(~self.leaf)[0]:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+        self.depth = int(depth.max()) if len(depth) else 0
+
+    @classmethod
+    def from_node(cls, root):
+        '''
+        Numbering the nodes breadth first, so every level of the tree is one 
+        run of the arrays. A leaf that kept a distribution as its label gets
+        the most probable label of it
+        '''
+        nodes = [root]
+        for node in nodes:
+            if not node.is_leaf:
+                nodes.extend((node.left_child, node.right_child))
+        number = {id(node): index for index, node in enumerate(nodes)}
+        feature = np.full(len(nodes), -1, dtype=np.int32)
+        threshold = np.zeros(len(nodes))
+        left = np.full(len(nodes), -1, dtype=np.int32)
+        right = np.full(len(nodes), -1, dtype=np.int32)
+        value = []
+        for index, node in enumerate(nodes):
+            label = node.class_label
+            if isinstance(label, dict):
+                label = max(label, key=label.get)
+            value.append(label)
+            if not node.is_leaf:
+                feature[index] = node.feature
+                threshold[index] = node.threshold
+                left[index] = number[id(node.left_child)]
+                right[index] = number[id(node.right_child)]
+        leaves = feature < 0
+        values = np.zeros(len(nodes), dtype=np.asarray([label for label, leaf in zip(value, leaves) if leaf]).dtype)
+        values[leaves] = [label for label, leaf in zip(value, leaves) if leaf]
+        return cls(feature, threshold, left, right, values)
+
+    def predict_many(self, features, chunk=65536):
+        '''
+        Routing all the rows down the tree together, one level at a time. The
+        rows move to a child with one comparison over all of them, going left
+        when their value is at or below the threshold like predict does, and
+        every few levels the rows that reached a leaf drop out once they are
+        the most. The rows go in chunks so the working arrays stay in cache
+        '''
+        features = np.asarray(features)
+        width = features.shape[1] if features.ndim == 2 else 0
+        values = features.reshape(-1)
+        reached = np.zeros(len(features), dtype=np.int32)
+        for start in range(0, len(features), chunk):
+            rows = np.arange(start, min(start + chunk, len(features)))
+            offsets = rows * width
+            node = np.zeros(len(rows), dtype=np.int32)
+            for level in range(self.depth):
+                goes_left = values.take(offsets + self.route_feature[node]) <= self.route_threshold[node]
+                node = self.route_right[node] - goes_left
+                if level % 4 == 3:
+                    done = self.leaf[node]
+                    if 2 * np.count_nonzero(done) > len(node):
+                        reached[rows[done]] = node[done]
+                        rows, offsets, node = rows[~done], offsets[~done], node[~done]
+            reached[rows] = node
+        return self.value[reached]
+
+def check_tree_options(max_depth, min_samples_leaf, max_leaf_nodes):
+    '''
+    Making sure the stopping rules can stop. A child with no examples would
+    give a split that keeps every row on one side, splitting the same node
+    again and again, so every leaf needs at least one example
+    '''
+    if min_samples_leaf < 1:
+        raise ValueError("min_samples_leaf has to be at least 1")
+    if max_depth is not None and max_depth < 0:
+        raise ValueError("max_depth can not be negative")
+    if max_leaf_nodes is not None and max_leaf_nodes < 1:
+        raise ValueError("max_leaf_nodes has to be at least 1")
+
+def bin_features(features, max_bins=256):
+    '''
+    Binning every feature once by its quantiles, so training on histograms
+    only has to count small integers. Each feature gets at most max_bins - 1
+    thresholds, the distinct quantiles of its values, and a value goes in the
+    bin of the number of thresholds below it, so a value is at or below the
+    threshold of bin b exactly when its bin is at most b. The bins are stored
+    as one uint8 matrix next to the list of thresholds of every feature
+    '''
+    features = np.asarray(features)
+    edges = bin_edges(features, max_bins)
+    binned = np.empty(features.shape, dtype=np.uint8)
+    for attribute, thresholds in enumerate(edges):
+        binned[:, attribute] = np.searchsorted(thresholds, features[:, attribute], side='left')
+    return binned, edges
+
+def bin_edges(features, max_bins=256):
+    '''
+    The thresholds of bin_features alone, read one column at a time so a
+    memory mapped matrix never has to be loaded whole
+    '''
+    if not 2 <= max_bins <= 256:
+        raise ValueError("max_bins has to be between 2 and 256")
+    quantiles = np.linspace(0, 1, max_bins + 1)[1:-1]
+    edges = []
+    for attribute in range(features.shape[1]):
+        column = np.asarray(features[:, attribute])
+        edges.append(np.unique(np.quantile(column, quantiles)) if len(column) else np.zeros(1))
+    return edges
 
 class DecisionTree:
 
-    def __init__(self, mode='optimized'):
+    def __init__(self, mode='optimized', thresholds='fixed', max_bins=None, seed=None, max_features=None,
+                 max_depth=None, min_samples_leaf=50, min_impurity_decrease=0.0, max_leaf_nodes=None, ccp_alpha=0.0):
         '''
-        Initializing the Decision tree and the mode to choose the attribute
+        Initializing the Decision tree and the mode to choose the attribute.
+        The thresholds are either the 'fixed' 50 evenly spaced values between
+        the min and max of an attribute, or every distinct 'midpoints' between
+        two neighbouring values of it. With max_bins the tree is trained on
+        quantile histograms instead, the thresholds being the bin edges. A
+        seed gives the tree its own random generator for the randomized 
+        mode, otherwise the random module is used. With max_features every
+        node only looks at that many attributes drawn at random, given as a
+        count, a fraction of the attributes, 'sqrt' or 'log2'.
+        
+        A node stops being split at max_depth, when a child would get fewer
+        than min_samples_leaf examples, or when the split gains less than
+        min_impurity_decrease of information. With max_leaf_nodes the tree
+        grows best first, always splitting the leaf whose split takes away the 
+        most entropy, until it has that many leaves. A ccp_alpha above 0 prunes
+        the tree by cost complexity once it is built
         '''
         self.root = None
+        self.flat = None
         self.mode = mode
+        self.thresholds = thresholds
+        self.max_bins = max_bins
+        self.random = random.Random(seed) if seed is not None else random
+        self.max_features = max_features
+        self.max_depth = max_depth
+        self.min_samples_leaf = min_samples_leaf
+        self.min_impurity_decrease = min_impurity_decrease
+        self.max_leaf_nodes = max_leaf_nodes
+        self.ccp_alpha = ccp_alpha
+        check_tree_options(max_depth, min_samples_leaf, max_leaf_nodes)
         
-    def distribution(self, examples):
+    def distribution(self, indices):
         '''
-        Returning the distribution with the probbailities and label as a dictionary
+        Returning the distribution with the probbailities and label as a dictionary,
+        with the labels in the order they first show up among the examples
         '''
-        return {label: count / len(examples) for label, count in Counter(example[-1] for example in examples).items()} if examples else {}
+        if not len(indices):
+            return {}
+        codes = self.label_codes[indices]
+        present, first = np.unique(codes, return_index=True)
+        counts = np.bincount(codes, minlength=len(self.classes))
+        return {self.classes[code].item(): counts[code] / len(indices) for code in present[np.argsort(first)]}
 
-    def build(self, examples, attributes):
+    def most_common_label(self, indices):
         '''
-        Starting the Decision Tree building process
+        The most common label of the examples, ties going to the label that
+        shows up first like Counter.most_common does
         '''
-        self.root = self.DTL(examples, attributes, None)
+        codes = self.label_codes[indices]
+        counts = np.bincount(codes, minlength=len(self.classes))
+        tied = np.nonzero(counts == counts.max())[0]
+        code = tied[0] if len(tied) == 1 else codes[np.isin(codes, tied)][0]
+        return self.classes[code].item()
 
-    def DTL(self, examples, attributes, default):
+    def build(self, features, labels, attributes=None, bins=None, sample=None):
+        '''
+        Starting the Decision Tree building process. The features are kept as
+        one matrix and the labels as one vector, and every node only holds the
+        indices of its examples in them, so no rows are ever copied. In the
+        histogram mode the features are binned first, unless the bins from
+        bin_features are passed in to share them between trees. A sample of
+        row indices, repeats allowed, trains the tree on those rows alone. The 
+        training arrays are let go of once the tree is built, so it only holds
+        its nodes and their compiled arrays for predict_many
+        '''
+        self.features = np.asarray(features)
+        self.classes, self.label_codes = np.unique(np.asarray(labels), return_inverse=True)
+        if attributes is None:
+            attributes = list(range(self.features.shape[1]))
+        if self.max_bins:
+            self.binned, self.bin_edges = bins if bins is not None else bin_features(self.features, self.max_bins)
+        indices = np.arange(len(self.label_codes)) if sample is None else np.asarray(sample)
+        if self.max_leaf_nodes:
+            self.root = self.grow_best_first(indices, attributes)
+        else:
+            self.root = self.DTL(indices, attributes, None)
+        if self.ccp_alpha:
+            self.prune(self.ccp_alpha)
+        self.flat = FlatTree.from_node(self.root)
+        self.features = self.label_codes = self.binned = None
+
+    def build_out_of_core(self, features, labels, attributes=None, edges=None, chunk_rows=1 << 18, scratch_dir=None):
+        '''
+        Building the tree breadth first over a memory mapped matrix, one level
+        per pass over the rows, for training sets that do not fit in memory.
+        Only the histograms of the open nodes of a level are held, so memory
+        goes with the size of the tree and the number of bins, and the node
+        every row is at is kept in a scratch file. The splits, the rule of 50
+        and the leaf labels are the ones DTL picks in the optimized histogram
+        mode, so with the same bin edges the trees are the same
+        '''
+        if not self.max_bins or self.mode != 'optimized' or self.max_features or self.max_leaf_nodes:
+            raise ValueError("out of core training needs the optimized mode with max_bins, and no max_features or max_leaf_nodes")
+        num_rows, num_features = features.shape
+        if attributes is None:
+            attributes = list(range(num_features))
+        self.bin_edges = edges if edges is not None else bin_edges(features, self.max_bins)
+
+        '''
+        A first pass over the labels alone to find the classes
+        '''
+        classes = np.zeros(0, dtype=np.asarray(labels[:0]).dtype)
+        for start in range(0, num_rows, chunk_rows):
+            classes = np.union1d(classes, np.asarray(labels[start:start + chunk_rows]))
+        self.classes = classes
+        if not num_rows:
+            self.root = TreeNode(is_leaf=True, class_label=None)
+            self.flat = None
+            return
+
+        with tempfile.TemporaryFile(dir=scratch_dir) as scratch:
+            node_of_row = np.memmap(scratch, dtype=np.int32, mode='w+', shape=(num_rows,))
+            self.root = TreeNode()
+            level = [self.root]
+            splits = None
+            counted = np.array([True])
+            parents = None
+            depth = 0
+            while level:
+                histograms, first_rows = self.stream_level(features, labels, node_of_row, splits, counted,
+                                                           len(level), chunk_rows)
+                if parents is not None:
+                    for slot in range(len(level)):
+                        if not counted[slot]:
+                            histograms[slot] = parents[slot // 2] - histograms[slot ^ 1]
+                level, splits, counted, parents = self.split_level(level, histograms, first_rows, attributes, depth)
+                depth += 1
+            del node_of_row
+        if self.ccp_alpha:
+            self.prune(self.ccp_alpha)
+        self.flat = FlatTree.from_node(self.root)
+
+    def stream_level(self, features, labels, node_of_row, splits, counted, num_nodes, chunk_rows):
+        '''
+        One pass over the rows. Every row still at an open node is first moved
+        to its child by the splits of the last level, then counted into the 
+        histogram of that child when the child is the counted one of its pair,
+        the other being its parent minus it. The first row of every class in
+        every node is kept too, for the ties of most_common_label
+        '''
+        num_features = len(self.bin_edges)
+        num_classes = len(self.classes)
+        size = num_features * self.max_bins * num_classes
+        histograms = np.zeros((num_nodes, num_features, self.max_bins, num_classes), dtype=np.int64)
+        first_rows = np.full((num_nodes, num_classes), np.iinfo(np.int64).max, dtype=np.int64)
+        for start in range(0, len(node_of_row), chunk_rows):
+            nodes = np.array(node_of_row[start:start + chunk_rows])
+            rows = np.nonzero(nodes >= 0)[0]
+            if splits is not None:
+                attribute, position, child = splits
+                at = nodes[rows]
+                goes_left = np.zeros(len(rows), dtype=bool)
+                inner = child[at] >= 0
+                for split_attribute in np.unique(attribute[at[inner]]):
+                    chosen = np.nonzero(inner & (attribute[at] == split_attribute))[0]
+                    values = np.asarray(features[start + rows[chosen], split_attribute])
+                    goes_left[chosen] = np.searchsorted(self.bin_edges[split_attribute], values, side='left') <= position[at[chosen]]
+                nodes[rows] = np.where(inner, child[at] + ~goes_left, -1)
+                node_of_row[start:start + chunk_rows] = nodes
+                rows = rows[inner]
+            at = nodes[rows]
+            codes = np.searchsorted(self.classes, np.asarray(labels[start + rows]))
+            np.minimum.at(first_rows, (at, codes), start + rows)
+            rows, at, codes = rows[counted[at]], at[counted[at]], codes[counted[at]]
+            if not len(rows):
+                continue
+            block = np.asarray(features[start + rows])
+            cells = at[:, None] * (num_features * self.max_bins) + (np.arange(num_features) * self.max_bins)[None, :]
+            for attribute, thresholds in enumerate(self.bin_edges):
+                cells[:, attribute] += np.searchsorted(thresholds, block[:, attribute], side='left')
+            cells = cells * num_classes + codes[:, None]
+            histograms += np.bincount(cells.ravel(), minlength=num_nodes * size).reshape(histograms.shape)
+        return histograms, first_rows
+
+    def split_level(self, level, histograms, first_rows, attributes, depth):
+        '''
+        Turning every open node of a level into a leaf or a split the way DTL
+        does from its histogram, with the same stopping rules, and laying out
+        the next level, the children of a split next to each other with the 
+        smaller one to be counted
+        '''
+        attribute = np.full(len(level), -1, dtype=np.int64)
+        position = np.zeros(len(level), dtype=np.int64)
+        child = np.full(len(level), -1, dtype=np.int64)
+        next_level, counted, parents = [], [], []
+        for slot, node in enumerate(level):
+            histogram = histograms[slot]
+            total = histogram[0].sum(axis=0)
+            present = np.nonzero(total)[0]
+            tied = np.nonzero(total == total.max())[0]
+            node.class_label = self.classes[tied[np.argmin(first_rows[slot, tied])]].item()
+            node.samples, node.errors = int(total.sum()), int(total.sum() - total.max())
+            if len(present) == 1 or (self.max_depth is not None and depth >= self.max_depth):
+                node.is_leaf = True
+                continue
+            max_gain = -1
+            best_attribute = best = None
+            for candidate in attributes:
+                thresholds, gains = self.histogram_gains(histogram, candidate)
+                if len(gains) and gains.max() > max_gain:
+                    best = int(np.argmax(gains))
+                    max_gain = gains[best]
+                    best_attribute = candidate
+            size_left = histogram[best_attribute, :best + 1].sum()
+            size_right = total.sum() - size_left
+            too_small = size_left < self.min_samples_leaf or size_right < self.min_samples_leaf
+            if too_small or (self.min_impurity_decrease and max_gain < self.min_impurity_decrease):
+                node.is_leaf = True
+                continue
+            node.feature, node.threshold = best_attribute, self.bin_edges[best_attribute][best]
+            node.left_child, node.right_child = TreeNode(), TreeNode()
+            attribute[slot], position[slot], child[slot] = best_attribute, best, len(next_level)
+            next_level.extend((node.left_child, node.right_child))
+            counted.extend((size_left <= size_right, size_left > size_right))
+            parents.append(histogram)
+        return next_level, (attribute, position, child), np.array(counted, dtype=bool), parents
+
+    def DTL(self, indices, attributes, default, histogram=None, depth=0):
         '''
         Setting up the base cases for the recursive function
         '''
-        if not examples:
+        tree = self.leaf(indices, default)
+        if tree.errors == 0:
+            return tree
+        split = self.find_split(indices, attributes, histogram, depth)
+        if split is None:
+            return tree
+
+        '''
+        Recursion starts here we will use this to build the tree
+        '''
+        best_attribute, best_threshold, indices_left, indices_right, histogram, gain = split
+        histogram_left = histogram_right = None
+        if histogram is not None:
+            histogram_left, histogram_right = self.child_histograms(histogram, indices_left, indices_right)
+        tree.is_leaf, tree.feature, tree.threshold = False, best_attribute, best_threshold
+        tree.left_child = self.DTL(indices_left, attributes, self.distribution(indices_left), histogram_left, depth + 1)
+        tree.right_child = self.DTL(indices_right, attributes, self.distribution(indices_right), histogram_right, depth + 1)
+
+        return tree
+
+    def leaf(self, indices, default):
+        '''
+        A leaf for the examples, labelled with the default when there are
+        none, with their label when they all have the same one, and with the
+        most common label otherwise
+        '''
+        if not len(indices):
             return TreeNode(is_leaf=True, class_label=default)
-        elif all(example[-1] == examples[0][-1] for example in examples):
-            return TreeNode(is_leaf=True, class_label=examples[0][-1])
+        codes = self.label_codes[indices]
+        if np.all(codes == codes[0]):
+            return TreeNode(is_leaf=True, class_label=self.classes[codes[0]].item(), samples=len(indices))
+        counts = np.bincount(codes, minlength=len(self.classes))
+        return TreeNode(is_leaf=True, class_label=self.most_common_label(indices), samples=len(indices),
+                        errors=len(indices) - int(counts.max()))
+
+    def find_split(self, indices, attributes, histogram, depth):
+        '''
+        Choosing the split of a node that is not pure, or None when one of 
+        the stopping rules says it stays a leaf. Returns the attribute, the
+        threshold, the indices going left and right, the histogram of the
+        node and the information gain of the split
+        '''
+        if self.max_depth is not None and depth >= self.max_depth:
+            return None
 
         '''
         Will choose the right attribute function based on what mode the user has chose
         '''
+        if self.max_bins and histogram is None:
+            histogram = self.node_histogram(indices)
+        candidates = self.feature_subset(attributes)
         if self.mode == 'optimized':
-            best_attribute, best_threshold = self.choose_attribute_optimized(examples, attributes)
+            best_attribute, best_threshold = self.choose_attribute_optimized(indices, candidates, histogram)
         elif self.mode == 'randomized':
-            best_attribute, best_threshold = self.choose_attribute_randomized(examples, attributes)
+            best_attribute, best_threshold = self.choose_attribute_randomized(indices, candidates, histogram)
 
         '''
         Using the best attribute and best threshold that we got from the chosse
-        attribute function we will split the examples
+        attribute function we will split the indices of the examples
         '''
-        examples_left = [example for example in examples if example[best_attribute] <= best_threshold]
-        examples_right = [example for example in examples if example[best_attribute] > best_threshold]
+        goes_left = self.features[indices, best_attribute] <= best_threshold
+        indices_left = indices[goes_left]
+        indices_right = indices[~goes_left]
 
         '''
-        We will be pruning based on the the condition of having less than 50 examples
-        we will remove that node and make the parent the new node
+        We will be pruning based on the the condition of having less than 
+        min_samples_leaf examples, 50 by default, or too little gain, and the
+        node stays a leaf
         '''
-        if len(examples_left) < 50 or len(examples_right) < 50:
-            most_common_label = Counter(example[-1] for example in examples).most_common(1)[0][0] if examples else None
-            return TreeNode(is_leaf=True, class_label=most_common_label)
+        if len(indices_left) < self.min_samples_leaf or len(indices_right) < self.min_samples_leaf:
+            return None
+        gain = None
+        if self.min_impurity_decrease or self.max_leaf_nodes:
+            gain = self.information_gain(indices, best_attribute, best_threshold)
+            if self.min_impurity_decrease and gain < self.min_impurity_decrease:
+                return None
+        return best_attribute, best_threshold, indices_left, indices_right, histogram, gain
 
+    def grow_best_first(self, indices, attributes):
         '''
-        Recursion starts here we will use this to build the tree
+        Growing the tree through a priority queue of the leaves that can be
+        split, by the entropy their split takes away from all the examples, 
+        which is the information gain times the number of examples. The best
+        one is split until the tree has max_leaf_nodes leaves, and the leaves
+        still in the queue then stay leaves
         '''
-        tree = TreeNode(feature=best_attribute, threshold=best_threshold)
-        tree.left_child = self.DTL(examples_left, attributes, self.distribution(examples_left))
-        tree.right_child = self.DTL(examples_right, attributes, self.distribution(examples_right))
+        queue = []
+        order = itertools.count()
+        root = self.open_leaf(indices, attributes, None, None, 0, queue, order)
+        leaves = 1
+        while queue and leaves < self.max_leaf_nodes:
+            _, _, tree, split, depth = heapq.heappop(queue)
+            best_attribute, best_threshold, indices_left, indices_right, histogram, gain = split
+            histogram_left = histogram_right = None
+            if histogram is not None:
+                histogram_left, histogram_right = self.child_histograms(histogram, indices_left, indices_right)
+            tree.is_leaf, tree.feature, tree.threshold = False, best_attribute, best_threshold
+            tree.left_child = self.open_leaf(indices_left, attributes, self.distribution(indices_left),
+                                             histogram_left, depth + 1, queue, order)
+            tree.right_child = self.open_leaf(indices_right, attributes, self.distribution(indices_right),
+                                              histogram_right, depth + 1, queue, order)
+            leaves += 1
+        return root
 
+    def open_leaf(self, indices, attributes, default, histogram, depth, queue, order):
+        '''
+        A new leaf of the best first growth, put in the queue with its split
+        when it has one
+        '''
+        tree = self.leaf(indices, default)
+        if tree.errors:
+            split = self.find_split(indices, attributes, histogram, depth)
+            if split is not None:
+                heapq.heappush(queue, (-split[5] * len(indices), next(order), tree, split, depth))
         return tree
 
-    def choose_attribute_optimized(self, examples, attributes):
+    def prune(self, ccp_alpha):
+        '''
+        Minimal cost complexity pruning. The cost of a subtree is the share of
+        the training examples its leaves get wrong plus ccp_alpha for every
+        leaf, so the inner node whose subtree saves the least error per extra
+        leaf, the weakest link, is turned into a leaf as long as that saving 
+        is at most ccp_alpha, and again until no such node is left
+        '''
+        if self.root is None:
+            raise ValueError("a loaded tree has no nodes to prune")
+        while not self.root.is_leaf:
+            links = []
+            self.subtree_errors(self.root, self.root.samples, links)
+            weakest = min(alpha for alpha, tree in links)
+            if weakest > ccp_alpha:
+                break
+            for alpha, tree in links:
+                if alpha == weakest:
+                    tree.is_leaf, tree.left_child, tree.right_child = True, None, None
+        self.flat = FlatTree.from_node(self.root)
+
+    def subtree_errors(self, tree, total, links):
+        '''
+        The errors and the number of leaves of a subtree, adding the error 
+        saved per extra leaf of every inner node in it to links
+        '''
+        if tree.is_leaf:
+            return tree.errors, 1
+        errors_left, leaves_left = self.subtree_errors(tree.left_child, total, links)
+        errors_right, leaves_right = self.subtree_errors(tree.right_child, total, links)
+        errors, leaves = errors_left + errors_right, leaves_left + leaves_right
+        links.append(((tree.errors - errors) / (total * (leaves - 1)), tree))
+        return errors, leaves
+
+    def feature_subset(self, attributes):
+        '''
+        The attributes a node chooses from, a random max_features of them in
+        their order when max_features is set
+        '''
+        if not self.max_features:
+            return attributes
+        if self.max_features == 'sqrt':
+            count = int(math.sqrt(len(attributes)))
+        elif self.max_features == 'log2':
+            count = int(math.log2(len(attributes)))
+        elif isinstance(self.max_features, float):
+            count = int(self.max_features * len(attributes))
+        else:
+            count = self.max_features
+        count = min(max(count, 1), len(attributes))
+        return sorted(self.random.sample(list(attributes), count))
+
+    def choose_attribute_optimized(self, indices, attributes, histogram=None):
         '''
         Initialize the attribute, threhold, and gain. We will loop over all the
-        attributes, finding the min and max of the attreibute and try 50 threshold
-        values between them. We do so by calculating the information gain and 
-        choosing the best attrribute and threshold based on that, and return it
+        attributes and score all of their thresholds at once with the sorted 
+        column sweep, or from the histogram of the node, choosing the best 
+        attrribute and threshold based on the information gain, and return it.
+        Ties go to the first attribute and the lowest threshold as before
         '''
         max_gain = -1
         best_attribute = None
         best_threshold = None
+        label_codes = self.label_codes[indices]
         for attribute in attributes:
-            attribute_values = [example[attribute] for example in examples]
-            L = min(attribute_values)
-            M = max(attribute_values)
-            for K in range(1, 51):
-                threshold = L + K * (M - L) / 51
-                gain = self.information_gain(examples, attribute, threshold)
-                if gain > max_gain:
-                    max_gain = gain
-                    best_attribute = attribute
-                    best_threshold = threshold
+            if histogram is not None:
+                thresholds, gains = self.histogram_gains(histogram, attribute)
+            else:
+                thresholds, gains = self.threshold_gains(self.features[indices, attribute], label_codes)
+            if len(gains) and gains.max() > max_gain:
+                best = int(np.argmax(gains))
+                max_gain = gains[best]
+                best_attribute = attribute
+                best_threshold = thresholds[best]
 
         return best_attribute, best_threshold
 
-    def choose_attribute_randomized(self, examples, attributes):
+    def choose_attribute_randomized(self, indices, attributes, histogram=None):
         '''
         Initialize the attribute, threhold, and gain. We will find a random
-        attribute rather than looping over all of it, finding the min and max 
-        of the attribute and try 50 threshold values between them. We do so by 
-        calculating the information gain and choosing the best attrribute and 
-        threshold based on that, and return it.
+        attribute rather than looping over all of it, and score all of its
+        thresholds at once with the sorted column sweep, or from the histogram
+        of the node, choosing the best threshold based on the information 
+        gain, and return it.
         '''
-        max_gain = -1
         best_threshold = None
-        attribute = random.choice(attributes)  
-
-        attribute_values = [example[attribute] for example in examples]
-        L = min(attribute_values)
-        M = max(attribute_values)
+        attribute = self.random.choice(attributes)  
 
-        for K in range(1, 51):
-            threshold = L + K * (M - L) / 51
-            gain = self.information_gain(examples, attribute, threshold)
-            if gain > max_gain:
-                max_gain = gain
-                best_threshold = threshold
+        if histogram is not None:
+            thresholds, gains = self.histogram_gains(histogram, attribute)
+        else:
+            thresholds, gains = self.threshold_gains(self.features[indices, attribute], self.label_codes[indices])
+        if len(gains):
+            best_threshold = thresholds[int(np.argmax(gains))]
 
         return attribute, best_threshold
 
+    def threshold_gains(self, values, label_codes):
+        '''
+        Scoring every threshold of one attribute in a single pass. The column
+        is sorted once and the class counts are summed cumulatively along it,
+        so the counts on the left of any threshold are the row of the sum at
+        the number of values below or at it, and the right is the total minus
+        the left. The fixed thresholds are the same 50 values as before, and
+        the midpoints between distinct values cost the same to score
+        '''
+        order = np.argsort(values, kind='stable')
+        sorted_values = values[order]
+        one_hot = np.zeros((len(values), len(self.classes)))
+        one_hot[np.arange(len(values)), label_codes[order]] = 1
+        cumulative = np.vstack([np.zeros((1, one_hot.shape[1])), np.cumsum(one_hot, axis=0)])
 
-    def information_gain(self, examples, attribute, threshold):
+        if self.thresholds == 'midpoints':
+            positions = np.nonzero(sorted_values[1:] != sorted_values[:-1])[0] + 1
+            thresholds = (sorted_values[positions - 1] + sorted_values[positions]) / 2
+            if not len(positions):
+                positions = np.array([len(values)])
+                thresholds = sorted_values[-1:].astype(float)
+        else:
+            L = sorted_values[0]
+            M = sorted_values[-1]
+            thresholds = L + np.arange(1, 51) * (M - L) / 51
+            positions = np.searchsorted(sorted_values, thresholds, side='right')
+
+        left = cumulative[positions]
+        right = cumulative[-1] - left
+        weighted_entropy = (left.sum(axis=1) * self.count_entropy(left) + right.sum(axis=1) * self.count_entropy(right)) / len(values)
+        return thresholds, self.count_entropy(cumulative[-1:])[0] - weighted_entropy
+
+    def node_histogram(self, indices):
+        '''
+        Counting the examples of a node by attribute, bin and class in one
+        bincount over the binned rows of the node
+        '''
+        num_features = self.binned.shape[1]
+        cells = (np.arange(num_features) * self.max_bins)[None, :] + self.binned[indices]
+        cells = cells * len(self.classes) + self.label_codes[indices][:, None]
+        counts = np.bincount(cells.ravel(), minlength=num_features * self.max_bins * len(self.classes))
+        return counts.reshape(num_features, self.max_bins, len(self.classes))
+
+    def child_histograms(self, histogram, indices_left, indices_right):
+        '''
+        Only the smaller child is counted, the other one is the histogram of
+        the parent minus it
+        '''
+        if len(indices_left) <= len(indices_right):
+            histogram_left = self.node_histogram(indices_left)
+            return histogram_left, histogram - histogram_left
+        histogram_right = self.node_histogram(indices_right)
+        return histogram - histogram_right, histogram_right
+
+    def histogram_gains(self, histogram, attribute):
+        '''
+        Scoring every bin edge of one attribute from the histogram of the node,
+        the class counts on the left of an edge being the sum of the bins up
+        to it
+        '''
+        thresholds = self.bin_edges[attribute]
+        left = np.cumsum(histogram[attribute], axis=0)[:len(thresholds)]
+        total = histogram[attribute].sum(axis=0)
+        right = total - left
+        weighted_entropy = (left.sum(axis=1) * self.count_entropy(left) + right.sum(axis=1) * self.count_entropy(right)) / total.sum()
+        return thresholds, self.count_entropy(total[None, :])[0] - weighted_entropy
+
+    def count_entropy(self, counts):
         '''
-        For all the splits we will call the entropy function to calculate the 
-        weighted entropy and summing it for all the splits
+        The entropy of every row of class counts, an empty row having none
         '''
-        splits = [[], []]
-        for ex in examples:
-            splits[ex[attribute] > threshold].append(ex)
+        totals = counts.sum(axis=1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            probabilities = counts / totals
+            terms = np.where(probabilities > 0, probabilities * np.log2(probabilities), 0.0)
+        return -terms.sum(axis=1)
+
 
-        weighted_entropy = sum((len(split) / len(examples)) * self.entropy(split) for split in splits)
+    def information_gain(self, indices, attribute, threshold):
+        '''
+        For the two splits we will calculate the weighted entropy from their
+        class counts and take it away from the entropy of all the examples
+        '''
+        goes_right = self.features[indices, attribute] > threshold
+        codes = self.label_codes[indices]
+        counts = np.array([np.bincount(codes[~goes_right], minlength=len(self.classes)),
+                           np.bincount(codes[goes_right], minlength=len(self.classes))])
+        weighted_entropy = (counts.sum(axis=1) * self.count_entropy(counts)).sum() / len(indices)
 
-        return self.entropy(examples) - weighted_entropy
+        return self.entropy(indices) - weighted_entropy
     
-    def entropy(self, examples):
+    def entropy(self, indices):
         '''
         We will calculate the entropy for the information gain and return it
         '''
-        label_counts = Counter(example[-1] for example in examples)
-        probabilities = [count / len(examples) for count in label_counts.values()]
-        return -sum(p * np.log2(p) for p in probabilities if p > 0)
+        return self.count_entropy(np.bincount(self.label_codes[indices], minlength=len(self.classes))[None, :])[0]
 
     def predict(self, example):
         '''
         By checking the tree feature and threshold we will figure out if it is 
         the right or left child of the tree, and return its class label
         '''
+        if self.root is None:
+            return self.flat.predict_many(np.asarray(example)[None, :])[0].item()
         tree = self.root
         while not tree.is_leaf:
             tree = tree.left_child if example[tree.feature] <= tree.threshold else tree.right_child
         return tree.class_label
 
+    def predict_many(self, features):
+        '''
+        Predicting the class label of every row of a matrix at once with the
+        compiled tree
+        '''
+        if self.flat is None:
+            self.flat = FlatTree.from_node(self.root)
+        return self.flat.predict_many(features)
+
+    def save(self, path):
+        '''
+        Saving the compiled tree with write_model
+        '''
+        if self.flat is None:
+            self.flat = FlatTree.from_node(self.root)
+        write_model(path, MODEL_TREE, [self.flat])
+
+    @classmethod
+    def load(cls, path):
+        '''
+        A tree saved with save, its arrays mapped from the file. It only
+        predicts, through the compiled arrays, since it has no nodes
+        '''
+        kind, flats = read_model(path)
+        if kind != MODEL_TREE:
+            raise ValueError(f"{path} holds a forest, not a tree")
+        tree = cls()
+        tree.flat = flats[0]
+        return tree
+
 
 class DecisionForest:
-    def __init__(self, num_trees):
+    def __init__(self, num_trees, max_bins=None, workers=1, seed=None, bootstrap=False, max_samples=None,
+                 max_features=None, tree_options=None):
         '''
-        Creating n number of trees based on the user choice
+        Creating n number of trees based on the user choice, trained on 
+        histograms of max_bins bins when it is given, over workers processes.
+        Every tree gets its own seed, drawn from seed or from the random 
+        module, so the forest is the same whatever the number of workers.
+        With bootstrap every tree trains on rows drawn with replacement, and
+        max_samples, a fraction of the rows, sets how many rows a tree gets,
+        drawn without replacement unless bootstrap is set. The trees are 
+        randomized, or with max_features optimized over that many random 
+        attributes at every node, and tree_options holds the stopping and 
+        pruning parameters of DecisionTree for all of them
         '''
         self.num_trees = num_trees
-        self.trees = [DecisionTree(mode="randomized") for tree in range(num_trees)]
+        self.max_bins = max_bins
+        self.workers = workers
+        self.seed = seed
+        self.bootstrap = bootstrap
+        self.max_samples = max_samples
+        self.max_features = max_features
+        self.tree_options = tree_options or {}
+        self.oob_accuracy = None
+        self.trees = []
 
-    def build(self, examples, attributes):
+    def build(self, features, labels):
         
         '''
-        We prepare the training data and send it to the decision tree class to
-        build the trees in our decision forest
+        We send the training matrix and labels to the decision tree class to
+        build the trees in our decision forest, all of them sharing the same
+        arrays rather than copies of the rows. With more than one worker the
+        arrays are put in shared memory once and the trees are built in a 
+        process pool, each worker mapping the same memory. When the trees are
+        trained on samples, the out of bag accuracy is worked out after
         '''
-        training_data = [examples[i] + [attributes[i]] for i in range(len(attributes))]
-        for tree in self.trees:
-            tree.build(training_data, list(range(len(examples[0]))))
+        features = np.asarray(features)
+        labels = np.asarray(labels)
+        bins = bin_features(features, self.max_bins) if self.max_bins else None
+        generator = random.Random(self.seed) if self.seed is not None else random
+        seeds = [generator.randrange(2 ** 32) for tree in range(self.num_trees)]
+        settings = {'max_bins': self.max_bins, 'max_features': self.max_features,
+                    'bootstrap': self.bootstrap, 'max_samples': self.max_samples, 'tree_options': self.tree_options}
+        if self.workers > 1 and self.num_trees > 1:
+            self.trees = build_trees_parallel(features, labels, bins, settings, seeds, self.workers)
+        else:
+            self.trees = [build_forest_tree(features, labels, bins, settings, seed) for seed in seeds]
+        self.oob_accuracy = None
+        if self.bootstrap or self.max_samples:
+            self.oob_accuracy = self.out_of_bag_accuracy(features, labels, seeds)
+
+    def out_of_bag_accuracy(self, features, labels, seeds):
+        '''
+        Every row is voted on by the trees whose sample left it out, drawing
+        the samples again from the seeds of the trees, and the accuracy is 
+        over the rows that got any vote, ties going to the smallest label
+        '''
+        classes, codes = np.unique(labels, return_inverse=True)
+        votes = np.zeros((len(labels), len(classes)), dtype=np.int32)
+        for tree, seed in zip(self.trees, seeds):
+            left_out = np.ones(len(labels), dtype=bool)
+            left_out[forest_sample(seed, len(labels), self.bootstrap, self.max_samples)] = False
+            rows = np.nonzero(left_out)[0]
+            if not len(rows):
+                continue
+            predicted = np.searchsorted(classes, tree.predict_many(features[rows]))
+            known = predicted < len(classes)
+            votes[rows[known], predicted[known]] += 1
+        voted = votes.sum(axis=1) > 0
+        if not voted.any():
+            return None
+        return np.mean(np.argmax(votes[voted], axis=1) == codes[voted])
 
     def predict_forest(self, example):
         '''
@@ -202,29 +832,321 @@ class DecisionForest:
         
         return potential_tie[0][0], tie, [potential_tie[0][0], potential_tie[1][0]] if tie else None
 
-    def calculate_accuracy(self, example, attributes):
+    def vote_many(self, features):
+        '''
+        The vote of predict_forest for every row of a matrix at once. Every
+        tree predicts all the rows, and a row goes to the label with the most
+        votes, ties going to the label the earlier tree voted for, which is
+        what Counter.most_common does. Returns the labels, whether each row
+        was a tie, and the label tied with the winner on the tied rows
+        '''
+        votes = np.stack([tree.predict_many(features) for tree in self.trees])
+        labels = np.unique(votes)
+        rows = np.arange(votes.shape[1])
+        rank = np.empty((votes.shape[1], len(labels)), dtype=np.int64)
+        for code, label in enumerate(labels):
+            voted = votes == label
+            first = np.where(voted.any(axis=0), np.argmax(voted, axis=0), len(self.trees))
+            rank[:, code] = voted.sum(axis=0) * (len(self.trees) + 1) + (len(self.trees) - first)
+        counts = rank // (len(self.trees) + 1)
+        winner = np.argmax(rank, axis=1)
+        rank[rows, winner] = -1
+        runner_up = np.argmax(rank, axis=1)
+        tie = (runner_up != winner) & (counts[rows, runner_up] > 0) & (counts[rows, runner_up] == counts[rows, winner])
+        return labels[winner], tie, labels[runner_up]
+
+    def calculate_accuracy(self, features, labels):
         '''
         Processing the accuracy of the decision forest
         '''
-        return (sum(self.predict_forest(example[i])[0] == attributes[i] for i in range(len(attributes)))) / len(attributes)
+        return np.mean(self.vote_many(features)[0] == np.asarray(labels))
+
+    def save(self, path):
+        '''
+        Saving the compiled trees of the forest with write_model
+        '''
+        for tree in self.trees:
+            if tree.flat is None:
+                tree.flat = FlatTree.from_node(tree.root)
+        write_model(path, MODEL_FOREST, [tree.flat for tree in self.trees])
+
+    @classmethod
+    def load(cls, path):
+        '''
+        A forest saved with save, the arrays of its trees mapped from the file
+        '''
+        kind, flats = read_model(path)
+        if kind != MODEL_FOREST:
+            raise ValueError(f"{path} holds a single tree, not a forest")
+        forest = cls(len(flats))
+        for flat in flats:
+            tree = DecisionTree(mode="randomized")
+            tree.flat = flat
+            forest.trees.append(tree)
+        return forest
+
+
+'''
+The file of a saved tree or forest. A 32 byte header holds the magic, the
+format version, whether it is a tree or a forest, the number of trees and the
+dtype of the leaf labels. Then every tree has its node count and the offset of
+its arrays, and the arrays of every tree follow as raw little endian feature,
+left and right int32, threshold float64 and value, each starting on 8 bytes,
+so the whole file can be memory mapped and every array viewed in place
+'''
+MODEL_MAGIC = b'DTMODEL\0'
+MODEL_VERSION = 1
+MODEL_TREE, MODEL_FOREST = 0, 1
+MODEL_HEADER = struct.Struct('<8sIII8s4x')
+MODEL_ENTRY = struct.Struct('<QQ')
+
+def model_arrays(flat, value_dtype):
+    '''
+    The arrays of a compiled tree in the order and dtypes of the file
+    '''
+    return [flat.feature.astype('<i4'), flat.left.astype('<i4'), flat.right.astype('<i4'),
+            flat.threshold.astype('<f8'), flat.value.astype(value_dtype)]
+
+def write_model(path, kind, flats):
+    '''
+    Writing compiled trees to path in the model file format, through a
+    partial file so a cut off write never replaces a good model
+    '''
+    value_kinds = {flat.value.dtype.kind for flat in flats}
+    if not value_kinds <= {'i', 'u', 'b', 'f'}:
+        raise ValueError("only trees with numeric labels can be saved")
+    value_dtype = np.dtype('<f8') if 'f' in value_kinds else np.dtype('<i8')
+    offset = MODEL_HEADER.size + MODEL_ENTRY.size * len(flats)
+    entries = []
+    for flat in flats:
+        entries.append((len(flat.feature), offset))
+        for array in model_arrays(flat, value_dtype):
+            offset += -(-array.nbytes // 8) * 8
+    with open(path + '.partial', 'wb') as file:
+        file.write(MODEL_HEADER.pack(MODEL_MAGIC, MODEL_VERSION, kind, len(flats), value_dtype.str.encode()))
+        for entry in entries:
+            file.write(MODEL_ENTRY.pack(*entry))
+        for flat in flats:
+            for array in model_arrays(flat, value_dtype):
+                file.write(array.tobytes())
+                file.write(bytes(-array.nbytes % 8))
+    os.replace(path + '.partial', path)
+
+def read_model(path):
+    '''
+    Mapping a model file and viewing the arrays of every tree in it, 
+    returning whether it is a tree or a forest and the compiled trees
+    '''
+    buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    if len(buffer) < MODEL_HEADER.size:
+        raise ValueError(f"{path} is not a saved model")
+    magic, version, kind, num_trees, value_dtype = MODEL_HEADER.unpack_from(buffer, 0)
+    if magic != MODEL_MAGIC:
+        raise ValueError(f"{path} is not a saved model")
+    if version != MODEL_VERSION:
+        raise ValueError(f"{path} is a version {version} model, this version reads version {MODEL_VERSION}")
+    value_dtype = np.dtype(value_dtype.rstrip(b'\0').decode())
+    dtypes = [np.dtype('<i4'), np.dtype('<i4'), np.dtype('<i4'), np.dtype('<f8'), value_dtype]
+    flats = []
+    for tree in range(num_trees):
+        num_nodes, offset = MODEL_ENTRY.unpack_from(buffer, MODEL_HEADER.size + MODEL_ENTRY.size * tree)
+        arrays = []
+        for dtype in dtypes:
+            arrays.append(np.ndarray(num_nodes, dtype=dtype, buffer=buffer, offset=offset))
+            offset += -(-num_nodes * dtype.itemsize // 8) * 8
+        feature, left, right, threshold, value = arrays
+        flats.append(FlatTree(feature, threshold, left, right, value))
+    return kind, flats
         
 
-def data_processing(file_path):
+'''
+The arrays a forest worker trains on, set up once per process by
+forest_worker_init from the shared memory blocks of the parent
+'''
+forest_worker_arrays = {}
+
+def share_array(array):
+    '''
+    Copying an array into a new shared memory block, returning the block
+    and what a worker needs to map it
+    '''
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+def forest_sample(seed, num_rows, bootstrap, max_samples):
+    '''
+    The sorted row indices a tree of the forest trains on, drawn from its
+    seed, or None for all the rows
+    '''
+    if not bootstrap and not max_samples:
+        return None
+    size = max(1, int(round(max_samples * num_rows))) if max_samples else num_rows
+    generator = np.random.default_rng(seed)
+    if bootstrap:
+        return np.sort(generator.integers(0, num_rows, size))
+    return np.sort(generator.choice(num_rows, min(size, num_rows), replace=False))
+
+def build_forest_tree(features, labels, bins, settings, seed):
+    '''
+    Building one tree of the forest on its sample, the same in a worker as
+    in the parent
+    '''
+    mode = "optimized" if settings['max_features'] else "randomized"
+    tree = DecisionTree(mode=mode, max_bins=settings['max_bins'], seed=seed, max_features=settings['max_features'],
+                        **settings['tree_options'])
+    sample = forest_sample(seed, len(labels), settings['bootstrap'], settings['max_samples'])
+    tree.build(features, labels, list(range(features.shape[1])), bins, sample)
+    return tree
+
+def forest_worker_init(shared, bin_edges, settings):
+    '''
+    Mapping the shared training arrays into a worker without copying them
+    '''
+    for name, (block_name, shape, dtype) in shared.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        forest_worker_arrays[name + '_block'] = block
+        forest_worker_arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    forest_worker_arrays['bin_edges'] = bin_edges
+    forest_worker_arrays['settings'] = settings
+
+def forest_worker_build(seed):
+    '''
+    Building one tree of the forest in a worker
+    '''
+    arrays = forest_worker_arrays
+    bins = (arrays['binned'], arrays['bin_edges']) if arrays['settings']['max_bins'] else None
+    return build_forest_tree(arrays['features'], arrays['labels'], bins, arrays['settings'], seed)
+
+def build_trees_parallel(features, labels, bins, settings, seeds, workers):
+    '''
+    Building the trees of a forest over a process pool. The features, labels
+    and bins are copied into shared memory once instead of being pickled for
+    every tree, and the trees come back in the order of their seeds
+    '''
+    arrays = {'features': features, 'labels': labels}
+    if bins is not None:
+        arrays['binned'] = bins[0]
+    blocks = []
+    shared = {}
+    try:
+        for name, array in arrays.items():
+            block, shared[name] = share_array(np.ascontiguousarray(array))
+            blocks.append(block)
+        bin_edges = bins[1] if bins is not None else None
+        with multiprocessing.Pool(min(workers, len(seeds)), initializer=forest_worker_init,
+                                  initargs=(shared, bin_edges, settings)) as pool:
+            return pool.map(forest_worker_build, seeds)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+def cache_paths(file_path):
+    '''
+    The memory mapped copies of a data file, the features and the labels 
+    each in a .npy file next to it
+    '''
+    return file_path + '.features.npy', file_path + '.labels.npy'
+
+def load_cache(file_path):
+    '''
+    Mapping the cached features and labels of a data file, as long as the
+    cache is not older than the file
     '''
-    We will process both the training and test files and convert the strings
-    into integers so we can do calculations later on and seperate the data into
-    features and class labels
+    paths = cache_paths(file_path)
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    if min(os.path.getmtime(path) for path in paths) < os.path.getmtime(file_path):
+        return None
+    return tuple(np.load(path, mmap_mode='r') for path in paths)
+
+def parse_chunks(file_path, chunk_rows):
     '''
-    data = []
+    Parsing a data file chunk_rows lines at a time, giving the float32
+    features and int32 labels of every chunk
+    '''
+    with open(file_path, 'r') as file:
+        while True:
+            lines = list(itertools.islice(file, chunk_rows))
+            if not lines:
+                break
+            data = np.loadtxt(lines, dtype=np.float64, ndmin=2)
+            if data.size:
+                yield data[:, :-1].astype(np.float32), data[:, -1].astype(np.int32)
+
+def write_cache(file_path, chunk_rows):
+    '''
+    Writing the parsed features and labels next to the data file. The rows 
+    are counted first, so every chunk goes straight into the mapped .npy 
+    files and the matrix is never held in memory, and the files are written
+    as partial files so a cut off write never looks like a cache
+    '''
+    num_rows, width = 0, None
     with open(file_path, 'r') as file:
         for line in file:
-            data.append([int(float(value)) for value in line.split()])
-            
-    features = [value[:] for value in data]  
-    labels = [value[-1] for value in data]    
-   
+            if line.strip():
+                num_rows += 1
+                if width is None:
+                    width = len(line.split())
+    if not num_rows:
+        raise ValueError(f"{file_path} has no examples")
+    paths = cache_paths(file_path)
+    features = np.lib.format.open_memmap(paths[0] + '.partial', mode='w+', dtype=np.float32,
+                                         shape=(num_rows, width - 1))
+    labels = np.lib.format.open_memmap(paths[1] + '.partial', mode='w+', dtype=np.int32, shape=(num_rows,))
+    row = 0
+    for chunk_features, chunk_labels in parse_chunks(file_path, chunk_rows):
+        if chunk_features.shape[1] != width - 1:
+            raise ValueError(f"{file_path} has rows of different lengths")
+        features[row:row + len(chunk_labels)] = chunk_features
+        labels[row:row + len(chunk_labels)] = chunk_labels
+        row += len(chunk_labels)
+    features.flush()
+    labels.flush()
+    del features, labels
+    for path in paths:
+        os.replace(path + '.partial', path)
+
+def data_processing(file_path, cache=False, chunk_rows=65536):
+    '''
+    We will process both the training and test files, parsing chunk_rows
+    lines at a time straight into arrays, and seperate the data into a float32
+    matrix of the features and an int32 vector of the class labels, the last
+    column. With cache the parsed arrays are written next to the file and 
+    always mapped from there, on the first run as on the next ones, instead 
+    of parsing the file again
+    '''
+    if cache:
+        cached = load_cache(file_path)
+        if cached is None:
+            write_cache(file_path, chunk_rows)
+            cached = load_cache(file_path)
+        return cached
+
+    chunks = list(parse_chunks(file_path, chunk_rows))
+    if not chunks:
+        raise ValueError(f"{file_path} has no examples")
+    features = np.concatenate([chunk_features for chunk_features, chunk_labels in chunks])
+    labels = np.concatenate([chunk_labels for chunk_features, chunk_labels in chunks])
     return features, labels
 
+def option_value(name, convert, default=None):
+    '''
+    Getting the value of an optional --name value command line parameter
+    '''
+    if name in sys.argv[4:]:
+        return convert(sys.argv[sys.argv.index(name, 4) + 1])
+    return default
+
+def features_value(value):
+    '''
+    The --max-features parameter, a count, a fraction, 'sqrt' or 'log2'
+    '''
+    if value in ('sqrt', 'log2'):
+        return value
+    return float(value) if '.' in value else int(value)
+
 def main():
     '''
     Initializing the training and test file along with the option the user chooses
@@ -234,51 +1156,105 @@ def main():
         sys.exit(0)
     
     training_file, test_file, option = sys.argv[1], sys.argv[2], sys.argv[3]
+    max_bins = option_value('--bins', int)
+    workers = option_value('--workers', int, 1)
+    out_of_core = '--out-of-core' in sys.argv[4:]
+    cache = '--cache' in sys.argv[4:] or out_of_core
+    if out_of_core and (option != 'optimized' or not max_bins):
+        print("--out-of-core works with the optimized option and --bins")
+        sys.exit(1)
+    save_model, load_model = option_value('--save-model', str), option_value('--load-model', str)
+    bootstrap = '--bootstrap' in sys.argv[4:]
+    max_samples = option_value('--max-samples', float)
+    max_features = option_value('--max-features', features_value)
+    tree_options = {'max_depth': option_value('--max-depth', int),
+                    'min_samples_leaf': option_value('--min-samples-leaf', int, 50),
+                    'min_impurity_decrease': option_value('--min-impurity-decrease', float, 0.0),
+                    'max_leaf_nodes': option_value('--max-leaf-nodes', int),
+                    'ccp_alpha': option_value('--ccp-alpha', float, 0.0)}
+    try:
+        check_tree_options(tree_options['max_depth'], tree_options['min_samples_leaf'], tree_options['max_leaf_nodes'])
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
     
+    if option not in ['optimized', 'randomized', 'forest3', 'forest15']:
+        print("Invalid option. Choose from 'optimized', 'randomized', 'forest3', 'forest15'.")
+        sys.exit(1)
+
+    '''
+    With a saved model nothing is trained and the training file is not read,
+    so a forest reports its accuracy on the test file instead
+    '''
+    test_features, test_labels = data_processing(test_file, cache)
+    forest_accuracy = None
+    if load_model:
+        if option in ['optimized', 'randomized']:
+            tree = DecisionTree.load(load_model)
+        else:
+            tree = DecisionForest.load(load_model)
+            forest_accuracy = tree.calculate_accuracy(test_features, test_labels)
+        run_model(tree, option, test_features, test_labels, forest_accuracy)
+        return
+
     '''
     We process the training and test files and set up the features and attributes
     '''
-    train_features, train_labels = data_processing(training_file)
-    test_features, test_labels = data_processing(test_file)
-    num_features = len(train_features[0])
+    train_features, train_labels = data_processing(training_file, cache)
+    num_features = train_features.shape[1]
     attributes = list(range(num_features))  
     
     '''
     We call the decisonn tree or forest based on what the user has mentioned
     in the command line arguments
     '''
-    if option == 'optimized' or option == 'randomized':
-        tree = DecisionTree(mode=option)
-        tree.build(train_features, attributes) 
+    if out_of_core:
+        tree = DecisionTree(mode=option, max_bins=max_bins, **tree_options)
+        tree.build_out_of_core(train_features, train_labels, attributes)
+
+    elif option == 'optimized' or option == 'randomized':
+        tree = DecisionTree(mode=option, max_bins=max_bins, **tree_options)
+        tree.build(train_features, train_labels, attributes) 
     
     elif option == 'forest3':
         print("in forest3")
-        forest = DecisionForest(num_trees=3)  
+        forest = DecisionForest(num_trees=3, max_bins=max_bins, workers=workers, bootstrap=bootstrap,
+                                max_samples=max_samples, max_features=max_features, tree_options=tree_options)  
         forest.build(train_features, train_labels)
         forest_accuracy = forest.calculate_accuracy(train_features, train_labels)
         tree = forest
     
     elif option == 'forest15':
         print("in forest15")
-        forest = DecisionForest(num_trees=15)  # Adjusted for random forest
+        forest = DecisionForest(num_trees=15, max_bins=max_bins, workers=workers, bootstrap=bootstrap,
+                                max_samples=max_samples, max_features=max_features, tree_options=tree_options)  # Adjusted for random forest
         forest.build(train_features, train_labels)  # Calling build method here
         forest_accuracy = forest.calculate_accuracy(train_features, train_labels)
         tree = forest
-        
-    else:
-        print("Invalid option. Choose from 'optimized', 'randomized', 'forest3', 'forest15'.")
-        sys.exit(1)
-    
+
+    if option not in ['optimized', 'randomized'] and tree.oob_accuracy is not None:
+        print(f"Out of Bag Accuracy = {tree.oob_accuracy}")
+    if save_model:
+        tree.save(save_model)
+    run_model(tree, option, test_features, test_labels, forest_accuracy)
+
+def run_model(tree, option, test_features, test_labels, forest_accuracy):
     '''
     We will generate the output file with the correct format, and here we will 
     get the accuracy calculations ready based on whether it is a decision tree
     or decision forest such that we can account for ties.
     '''
+    if option in ['optimized', 'randomized']:
+        predictions = tree.predict_many(test_features)
+        ties = np.zeros(len(predictions), dtype=bool)
+        runners_up = predictions
+    else:
+        predictions, ties, runners_up = tree.vote_many(test_features)
     total_accuracy = 0
     with open('output.txt', 'w') as file:
-        for i, test_instance in enumerate(test_features):
-            predicted_class, is_tie, tied_classes = (tree.predict(test_instance), False, None) if option in ['optimized', 'randomized'] else tree.predict_forest(test_instance)
-            true_class = test_labels[i]
+        for i in range(len(test_features)):
+            predicted_class, is_tie, true_class = predictions[i], ties[i], test_labels[i]
+            tied_classes = [predicted_class, runners_up[i]] if is_tie else None
             accuracy = 1 if predicted_class == true_class else 0
             if is_tie:
                 accuracy = 1 / len(tied_classes) if true_class in tied_classes else 0
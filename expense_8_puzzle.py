@@ -1,14 +1,639 @@
+import os
 import sys
+import json
+import math
+import mmap
+import array
 import heapq
+import struct
+import collections
+import argparse
+import multiprocessing
+import time
+import itertools
 import datetime
 
 
 
+class Search_Limit_Reached(Exception):
+    '''
+    Raised inside a search when it goes over the node or time limit it was given.
+    '''
+
+
+'''
+Pattern databases that have already been built or loaded in this process, keyed
+by the board size, the goal configuration and the tiles of the pattern, so
+puzzles sharing a goal share the tables too.
+'''
+pattern_database_cache = {}
+
+
+class Pattern_Database:
+
+    '''
+    A pattern database holds, for every placement of a group of tiles on the
+    board, the cheapest cost of moving just those tiles into their goal cells.
+    Only moves of the pattern tiles are paid for, at the value of the tile, so
+    the databases of disjoint groups of tiles can be added together and still
+    never overestimate the real cost. The table is indexed by the rank of the
+    positions of the pattern tiles and stored as an array of 16 bit costs.
+    '''
+    def __init__(self, size, tiles, table):
+        self.size = size
+        self.tiles = tuple(tiles)
+        self.table = table
+
+    '''
+    Ranking the positions of the pattern tiles as a partial permutation of the
+    cells, so the table only has an entry for every placement that can happen.
+    '''
+    @staticmethod
+    def rank(positions, cells):
+        index = 0
+        for i, position in enumerate(positions):
+            index = index * (cells - i) + position - sum(1 for earlier in positions[:i] if earlier < position)
+        return index
+
+    @staticmethod
+    def entries(cells, length):
+        count = 1
+        for i in range(length):
+            count *= cells - i
+        return count
+
+    '''
+    Building the table with a backwards Dijkstra from the goal over the
+    placements of the pattern tiles alone. A pattern tile may move to any
+    neighbouring cell that holds no other pattern tile, at the value of the
+    tile, since the blank could be brought there by moving the other tiles for
+    free. Every real move is then a move of the abstraction, or leaves it as
+    it is, so the table never drops by more than the cost of a move and the
+    sum of the disjoint tables is a consistent heuristic, which A* needs to
+    never close a state on a costlier path. Moves are reversible with the same
+    cost, so the cost from the goal is the cost to the goal. The costs are
+    kept in a flat 16 bit array indexed by the rank of the placement, so the
+    larger patterns of the 15 and 24 puzzle fit in memory.
+    '''
+    @classmethod
+    def build(cls, size, goal, tiles, neighbours):
+        cells = size * size
+        flat_goal = [tile for row in goal for tile in row]
+        start = tuple(flat_goal.index(tile) for tile in tiles)
+        table = array.array('H', [0xFFFF]) * cls.entries(cells, len(tiles))
+        table[cls.rank(start, cells)] = 0
+        fringe = [(0, start)]
+        while fringe:
+            cost, positions = heapq.heappop(fringe)
+            if cost > table[cls.rank(positions, cells)]:
+                continue
+            for i, cell in enumerate(positions):
+                for position, _ in neighbours[cell]:
+                    if position in positions:
+                        continue
+                    child = positions[:i] + (position,) + positions[i + 1:]
+                    child_cost = cost + tiles[i]
+                    child_index = cls.rank(child, cells)
+                    if child_cost < table[child_index]:
+                        if child_cost >= 0xFFFF:
+                            raise ValueError(f"Pattern {tiles} costs more than a 16 bit table can hold")
+                        table[child_index] = child_cost
+                        heapq.heappush(fringe, (child_cost, child))
+        return cls(size, tiles, table)
+
+    '''
+    The file starts with a small header of the magic, the version, the board
+    size and the pattern tiles, padded to 64 bytes, followed by the raw table.
+    '''
+    HEADER = struct.Struct('<4sHHH')
+    HEADER_SIZE = 64
+    VERSION = 2
+
+    def save(self, path):
+        header = self.HEADER.pack(b'EPDB', self.VERSION, self.size, len(self.tiles))
+        header += bytes(self.tiles)
+        with open(path, 'wb') as file:
+            file.write(header.ljust(self.HEADER_SIZE, b'\0'))
+            file.write(self.table.tobytes())
+
+    '''
+    Loading a saved table by memory mapping the file, so starting up only
+    costs reading the pages of the table that the search actually touches.
+    '''
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, size, length = cls.HEADER.unpack_from(mapped)
+        if magic != b'EPDB' or version != cls.VERSION:
+            raise ValueError(f"{path} is not a pattern database file")
+        tiles = tuple(mapped[cls.HEADER.size:cls.HEADER.size + length])
+        table = memoryview(mapped)[cls.HEADER_SIZE:].cast('H')
+        return cls(size, tiles, table)
+
+    '''
+    Getting the database of a group of tiles for a goal, from this process if
+    it was used before, else from the cache directory, else by building it and
+    saving it there for the next run.
+    '''
+    @classmethod
+    def for_goal(cls, size, goal, tiles, neighbours, cache_dir='pdb_cache'):
+        goal_key = tuple(tile for row in goal for tile in row)
+        key = (size, goal_key, tuple(tiles))
+        if key in pattern_database_cache:
+            return pattern_database_cache[key]
+        name = f"pdb-{size}x{size}-{'-'.join(map(str, goal_key))}-tiles-{'-'.join(map(str, tiles))}.bin"
+        path = os.path.join(cache_dir, name) if cache_dir else None
+        database = None
+        if path and os.path.exists(path):
+            try:
+                database = cls.load(path)
+            except ValueError:
+                '''
+                A table saved by an older version is built again.
+                '''
+                database = None
+        if database is None:
+            database = cls.build(size, goal, tiles, neighbours)
+            if path:
+                os.makedirs(cache_dir, exist_ok=True)
+                database.save(path)
+        pattern_database_cache[key] = database
+        return database
+
+    '''
+    The cost of the pattern tiles given where each tile is on the board.
+    '''
+    def lookup(self, where):
+        return self.table[self.rank([where[tile] for tile in self.tiles], self.size * self.size)]
+
+
+class Solution_Table:
+
+    '''
+    With a fixed goal the whole reachable state space of the 8 puzzle is small
+    enough to solve once. The table holds, for every board ranked by its Lehmer
+    code, the cheapest cost to the goal and the cell of the tile to move next
+    on a cheapest path, so solving any start is a walk down the table with no
+    search at all. Boards that cannot reach the goal keep the UNREACHED cost.
+    '''
+    HEADER = struct.Struct('<4sHH')
+    HEADER_SIZE = 64
+    VERSION = 1
+    UNREACHED = 0xFFFF
+
+    def __init__(self, size, costs, moves):
+        self.size = size
+        self.costs = costs
+        self.moves = moves
+
+    '''
+    The Lehmer code of a board given as the tile on every cell, packed or not.
+    '''
+    def rank(self, tiles):
+        return Pattern_Database.rank(tiles, self.size * self.size)
+
+    '''
+    Running a single backwards Dijkstra from the goal over every reachable
+    board. Moves cost the same in both directions, so when a board is reached
+    from its parent the move back to the parent is its next move to the goal.
+    '''
+    @classmethod
+    def build(cls, puzzle):
+        cells = puzzle.size * puzzle.size
+        if cells > 9:
+            raise ValueError("The full solution table is only built for the 3x3 puzzle")
+        table = cls(puzzle.size, array.array('H', [cls.UNREACHED]) * math.factorial(cells),
+                    array.array('b', [-1]) * math.factorial(cells))
+        best = {puzzle.goal_code: 0}
+        fringe = [(0, puzzle.goal_code, puzzle.goal_blank)]
+        while fringe:
+            cost, code, blank = heapq.heappop(fringe)
+            if cost > best[code]:
+                continue
+            table.costs[table.rank(puzzle.unpack(code))] = cost
+            for child, child_blank, tile, _ in puzzle.expand(code, blank):
+                child_cost = cost + tile
+                if child_cost < best.get(child, child_cost + 1):
+                    best[child] = child_cost
+                    table.moves[table.rank(puzzle.unpack(child))] = blank
+                    heapq.heappush(fringe, (child_cost, child, child_blank))
+        return table
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            file.write(self.HEADER.pack(b'ESOL', self.VERSION, self.size).ljust(self.HEADER_SIZE, b'\0'))
+            file.write(self.costs.tobytes())
+            file.write(self.moves.tobytes())
+
+    '''
+    Memory mapping a saved table, the costs followed by the next moves.
+    '''
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, size = cls.HEADER.unpack_from(mapped)
+        if magic != b'ESOL' or version != cls.VERSION:
+            raise ValueError(f"{path} is not a solution table file")
+        count = math.factorial(size * size)
+        view = memoryview(mapped)[cls.HEADER_SIZE:]
+        return cls(size, view[:2 * count].cast('H'), view[2 * count:3 * count].cast('b'))
+
+    '''
+    Getting the table for the goal of a puzzle from this process, the cache
+    directory, or by building and saving it, like the pattern databases.
+    '''
+    @classmethod
+    def for_goal(cls, puzzle, cache_dir='pdb_cache'):
+        goal_key = tuple(tile for row in puzzle.puzzle_goal for tile in row)
+        key = ('solution', puzzle.size, goal_key)
+        if key in pattern_database_cache:
+            return pattern_database_cache[key]
+        name = f"solution-{puzzle.size}x{puzzle.size}-{'-'.join(map(str, goal_key))}.bin"
+        path = os.path.join(cache_dir, name) if cache_dir else None
+        if path and os.path.exists(path):
+            table = cls.load(path)
+        else:
+            table = cls.build(puzzle)
+            if path:
+                os.makedirs(cache_dir, exist_ok=True)
+                table.save(path)
+        pattern_database_cache[key] = table
+        return table
+
+    '''
+    Following the next moves from the start of a puzzle to its goal, returning
+    the moves made, or None when the start cannot reach the goal.
+    '''
+    def walk(self, puzzle):
+        code, blank = puzzle.start_code, puzzle.start_blank
+        if self.costs[self.rank(puzzle.unpack(code))] == self.UNREACHED:
+            return None
+        path = []
+        while code != puzzle.goal_code:
+            position = self.moves[self.rank(puzzle.unpack(code))]
+            for child, child_blank, tile, direction in puzzle.expand(code, blank):
+                if child_blank == position:
+                    path.append((tile, direction))
+                    code, blank = child, child_blank
+                    break
+        return path
+
+
+class Search_Trace:
+
+    '''
+    The search trace dump written while a search runs. Rather than writing the
+    whole fringe and closed set at every step, every pop, push and close is
+    written as one small event through a large write buffer, and the counters
+    with the fringe and closed sizes are written as a snapshot every
+    snapshot_every pops. The events can be sampled to every sample-th pop, with
+    the pushes and closes of the pops that are skipped left out as well.
+    The format is 'text' (one line per event), 'jsonl' or 'binary'.
+    '''
+    FORMATS = {'text': 'txt', 'jsonl': 'jsonl', 'binary': 'bin'}
+    EVENTS = {'pop': 1, 'push': 2, 'close': 3, 'snapshot': 4, 'solution': 5}
+    RECORD = struct.Struct('<BiB')
+    SNAPSHOT_FIELDS = ('nodes_popped', 'nodes_expanded', 'nodes_generated', 'max_fringe_size',
+                       'fringe_size', 'closed_size', 'depth')
+    SNAPSHOT = struct.Struct('<8q')
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, format='text', sample=1, snapshot_every=1000, filename=None):
+        if format not in self.FORMATS:
+            raise ValueError(f"Unknown trace format {format}, choose from {', '.join(self.FORMATS)}")
+        self.format = format
+        self.sample = max(1, sample)
+        self.snapshot_every = snapshot_every
+        self.filename = filename
+        self.file = None
+
+    '''
+    Opening the trace file for a search, with the same unique naming by time
+    as before unless a file name was given.
+    '''
+    def open(self, puzzle, title):
+        self.puzzle = puzzle
+        self.pops = 0
+        self.active = True
+        if not self.filename:
+            file_time = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+            self.filename = f"trace-{file_time}.{self.FORMATS[self.format]}"
+        if self.format == 'binary':
+            self.file = open(self.filename, 'wb', buffering=self.BUFFER_SIZE)
+            name = title.encode()
+            self.file.write(b'ETRC' + struct.pack('<HB', puzzle.size, len(name)) + name)
+        else:
+            self.file = open(self.filename, 'w', buffering=self.BUFFER_SIZE)
+            self.write_event('title', None, title=title)
+        return self
+
+    '''
+    Writing one event in the format of the trace. Binary events are a record of
+    the event type, the cost (-1 if there is none) and the length of the packed
+    state followed by its bytes, or the event type followed by the counters
+    for snapshots and solutions, -1 standing for the ones that do not apply.
+    '''
+    def write_event(self, event, code, cost=None, **values):
+        if self.format == 'text':
+            if event == 'title':
+                self.file.write(f"{values['title']} \n")
+            elif event == 'snapshot':
+                self.file.write("------------------------\n")
+                self.file.write("".join(f"{name.replace('_', ' ').title()}: {value}\n" for name, value in values.items()))
+            elif event == 'solution':
+                self.file.write("\n\n\nFinal Output\n\n")
+                self.file.write("".join(f"{name.replace('_', ' ').title()}: {values[name]}\n" for name in self.SNAPSHOT_FIELDS[:4]))
+                if values.get('depth') is None:
+                    self.file.write("Solution Not Found\n")
+                else:
+                    self.file.write(f"Solution Found at depth {values['depth']} with cost of {cost}.\n")
+            else:
+                self.file.write(f"{event} {self.puzzle.decode(code)}" + (f" cost {cost}\n" if cost is not None else "\n"))
+        elif self.format == 'jsonl':
+            record = {'event': event}
+            if code is not None:
+                record['state'] = self.puzzle.unpack(code)
+            if cost is not None:
+                record['cost'] = cost
+            record.update(values)
+            self.file.write(json.dumps(record) + "\n")
+        elif event in ('snapshot', 'solution'):
+            fields = [values.get(name) for name in self.SNAPSHOT_FIELDS] + [cost]
+            self.file.write(bytes([self.EVENTS[event]]) + self.SNAPSHOT.pack(*(-1 if value is None else value for value in fields)))
+        else:
+            data = code.to_bytes((code.bit_length() + 7) // 8, 'little')
+            self.file.write(self.RECORD.pack(self.EVENTS[event], -1 if cost is None else cost, len(data)) + data)
+
+    def counters(self):
+        return {'nodes_popped': self.puzzle.nodes_popped, 'nodes_expanded': self.puzzle.nodes_expanded,
+                'nodes_generated': self.puzzle.nodes_generated, 'max_fringe_size': self.puzzle.max_fringe_size}
+
+    '''
+    A state was popped off the fringe. This decides if the events up to the
+    next pop are sampled, and writes a snapshot every snapshot_every pops.
+    '''
+    def pop(self, code, cost=None, fringe_size=None, closed_size=None):
+        self.pops += 1
+        if self.snapshot_every and self.pops % self.snapshot_every == 0:
+            self.write_event('snapshot', None, **self.counters(), fringe_size=fringe_size, closed_size=closed_size)
+        self.active = (self.pops - 1) % self.sample == 0
+        if self.active:
+            self.write_event('pop', code, cost)
+
+    def push(self, code, cost=None):
+        if self.active:
+            self.write_event('push', code, cost)
+
+    def close_state(self, code):
+        if self.active:
+            self.write_event('close', code)
+
+    '''
+    Writing the final counters along with the solution, if one was found, and
+    closing the file. Returns the name of the trace file.
+    '''
+    def finish(self, steps=None, cost=None):
+        if steps is None:
+            self.write_event('solution', None, **self.counters())
+        else:
+            self.write_event('solution', None, cost, **self.counters(), depth=len(steps))
+        self.file.close()
+        return self.filename
+
+
+class Search_Checkpoint:
+
+    '''
+    A snapshot of a running BFS, DFS, UCS, Greedy or A* search that the search
+    can be resumed from after the process was stopped. It holds the counters,
+    the parent table of every state reached, with its move, cost and whether
+    it was closed, and the fringe in the order it was pushed. Everything is
+    stored in columns: the packed states as 64 bit words, the tiles,
+    directions and closed marks as bytes and the costs as 32 bit integers, so the
+    file stays small and is written without going through pickle. The search
+    saves a snapshot every every_pops pops or every_seconds seconds, and
+    resumes from path when the file is there.
+    '''
+    HEADER = struct.Struct('<4sHHH32s4qQQ')
+    VERSION = 1
+    DIRECTIONS = ['Left', 'Right', 'Up', 'Down']
+    NO_MOVE = 255
+
+    def __init__(self, path, every_seconds=60, every_pops=None):
+        self.path = path
+        self.every_seconds = every_seconds
+        self.every_pops = every_pops
+        self.last_saved = time.monotonic()
+        self.last_pops = 0
+        self.saves = 0
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def discard(self):
+        if self.exists():
+            os.remove(self.path)
+
+    '''
+    Whether a snapshot is due, only looking at the clock every 1024 pops.
+    '''
+    def due(self, nodes_popped):
+        if nodes_popped == self.last_pops:
+            return False
+        if self.every_pops and nodes_popped % self.every_pops == 0:
+            return True
+        return (self.every_seconds is not None and nodes_popped % 1024 == 0
+                and time.monotonic() - self.last_saved >= self.every_seconds)
+
+    '''
+    Splitting packed states into columns of 64 bit words and joining them back.
+    '''
+    @staticmethod
+    def state_columns(states, words):
+        return [array.array('Q', [(state >> (64 * word)) & 0xFFFFFFFFFFFFFFFF for state in states])
+                for word in range(words)]
+
+    @staticmethod
+    def join_states(columns):
+        if len(columns) == 1:
+            return list(columns[0])
+        return [sum(value << (64 * word) for word, value in enumerate(values)) for values in zip(*columns)]
+
+    '''
+    Writing the snapshot. table is a list of (state, move, cost, closed) and
+    fringe a list of (state, blank, move, cost, heuristic, priority) in push
+    order, the move being (parent, tile, direction) or None. The file is
+    written next to the old one and renamed over it, so a process killed
+    while saving still leaves the last complete snapshot.
+    '''
+    def save(self, puzzle, title, table, fringe):
+        words = (puzzle.size * puzzle.size * puzzle.cell_bits + 63) // 64
+        columns = self.state_columns([puzzle.start_code, puzzle.goal_code], words)
+        for states, moves in (([state for state, _, _, _ in table], [move for _, move, _, _ in table]),
+                              ([state for state, _, _, _, _, _ in fringe], [move for _, _, move, _, _, _ in fringe])):
+            columns += self.state_columns(states, words)
+            columns += self.state_columns([move[0] if move else 0 for move in moves], words)
+            columns.append(array.array('B', [move[1] if move else self.NO_MOVE for move in moves]))
+            columns.append(array.array('B', [self.DIRECTIONS.index(move[2]) if move else self.NO_MOVE for move in moves]))
+        columns.append(array.array('B', [closed for _, _, _, closed in table]))
+        columns.append(array.array('I', [cost for _, _, cost, _ in table]))
+        columns.append(array.array('B', [blank for _, blank, _, _, _, _ in fringe]))
+        columns.append(array.array('I', [cost for _, _, _, cost, _, _ in fringe]))
+        columns.append(array.array('I', [heuristic for _, _, _, _, heuristic, _ in fringe]))
+        columns.append(array.array('d', [priority for _, _, _, _, _, priority in fringe]))
+        header = self.HEADER.pack(b'ECKP', self.VERSION, puzzle.size, words, title.encode()[:32],
+                                  puzzle.nodes_popped, puzzle.nodes_expanded, puzzle.nodes_generated,
+                                  puzzle.max_fringe_size, len(table), len(fringe))
+        partial = self.path + ".partial"
+        with open(partial, 'wb') as file:
+            file.write(header)
+            for column in columns:
+                column.tofile(file)
+        os.replace(partial, self.path)
+        self.last_saved = time.monotonic()
+        self.last_pops = puzzle.nodes_popped
+        self.saves += 1
+
+    '''
+    Reading the snapshot back for a search with the given title on a puzzle,
+    restoring the counters of the puzzle and returning the table and the
+    fringe in the form save took them.
+    '''
+    def load(self, puzzle, title):
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        magic, version, size, words, saved_title, popped, expanded, generated, max_fringe, table_size, fringe_size = \
+            self.HEADER.unpack_from(data)
+        if magic != b'ECKP' or version != self.VERSION:
+            raise ValueError(f"{self.path} is not a search checkpoint file")
+        offset = self.HEADER.size
+
+        def column(typecode, count):
+            nonlocal offset
+            values = array.array(typecode)
+            values.frombytes(data[offset:offset + count * values.itemsize])
+            offset += count * values.itemsize
+            return values
+
+        def states(count):
+            return self.join_states([column('Q', count) for word in range(words)])
+
+        start_code, goal_code = states(2)
+        if (size, start_code, goal_code) != (puzzle.size, puzzle.start_code, puzzle.goal_code):
+            raise ValueError(f"{self.path} is the checkpoint of a different puzzle")
+        saved_title = saved_title.rstrip(b'\0')
+        if saved_title != title.encode()[:32]:
+            raise ValueError(f"{self.path} is the checkpoint of a {saved_title.decode()} search")
+        parts = []
+        for count in (table_size, fringe_size):
+            codes, parents = states(count), states(count)
+            tiles, directions = column('B', count), column('B', count)
+            parts.append((codes, parents, tiles, directions))
+        closed, costs = column('B', table_size), column('I', table_size)
+        blanks, fringe_costs = column('B', fringe_size), column('I', fringe_size)
+        heuristics, priorities = column('I', fringe_size), column('d', fringe_size)
+
+        moves = [[None if tiles[i] == self.NO_MOVE else (parents[i], tiles[i], self.DIRECTIONS[directions[i]])
+                  for i in range(len(codes))] for codes, parents, tiles, directions in parts]
+        table = [(parts[0][0][i], moves[0][i], costs[i], bool(closed[i])) for i in range(table_size)]
+        fringe = [(parts[1][0][i], blanks[i], moves[1][i], fringe_costs[i], heuristics[i], priorities[i])
+                  for i in range(fringe_size)]
+        puzzle.nodes_popped, puzzle.nodes_expanded = popped, expanded
+        puzzle.nodes_generated, puzzle.max_fringe_size = generated, max_fringe
+        self.last_pops = popped
+        return table, fringe
+
+
+class Search_Node:
+
+    '''
+    A node kept in memory by the memory bounded A*. Unlike the other searches
+    a node here has to know its children that are still in memory and the f
+    values of the ones that were forgotten, so it can be opened again to
+    regenerate them later.
+    '''
+    def __init__(self, code, blank, g, value, f, depth, parent=None, tile=None, direction=None):
+        self.code = code
+        self.blank = blank
+        self.g = g
+        self.value = value
+        self.f = f
+        self.depth = depth
+        self.parent = parent
+        self.tile = tile
+        self.direction = direction
+        self.children = {}
+        self.forgotten = {}
+        self.in_open = False
+        self.alive = True
+
+
+'''
+The frontiers the searches keep their fringe in. All three have the same
+push, pop and len, so the loop of a search does not depend on the order the
+states come out in: first in first out for BFS, last in first out for DFS,
+DLS and IDS, and lowest priority first for UCS, Greedy and A*.
+'''
+class FIFO_Frontier:
+
+    def __init__(self):
+        self.entries = collections.deque()
+
+    def push(self, entry, priority=None):
+        self.entries.append(entry)
+
+    def pop(self):
+        return self.entries.popleft()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class LIFO_Frontier:
+
+    def __init__(self):
+        self.entries = []
+
+    def push(self, entry, priority=None):
+        self.entries.append(entry)
+
+    def pop(self):
+        return self.entries.pop()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class Priority_Frontier:
+
+    '''
+    A binary heap of (priority, push order, entry). Ties on the priority are
+    broken on the order the entries were pushed in, so the heap never has to
+    compare two entries.
+    '''
+    def __init__(self):
+        self.entries = []
+        self.order = itertools.count()
+
+    def push(self, entry, priority=None):
+        heapq.heappush(self.entries, (priority, next(self.order), entry))
+
+    def pop(self):
+        return heapq.heappop(self.entries)[2]
+
+    def __len__(self):
+        return len(self.entries)
+
+
 class Expense_Puzzle:
     
     '''
     Initializing the Expense Puzzle node to store required data and to 
     instantiate the values needed to be printed in the end for the users.
+    The boards are also packed into the compact integer form that the search
+    methods work on, along with the neighbour table used to expand them.
     '''
     def __init__(self, puzzle_start, puzzle_goal):
         self.puzzle_start = puzzle_start
@@ -18,6 +643,108 @@ class Expense_Puzzle:
         self.nodes_generated = 0
         self.max_fringe_size = 0
 
+        self.size = len(puzzle_start)
+        self.check_boards(puzzle_start, puzzle_goal)
+        self.cell_bits = max(4, (self.size * self.size - 1).bit_length())
+        self.cell_mask = (1 << self.cell_bits) - 1
+        self.neighbours = self.neighbour_table()
+        self.start_code, self.start_blank = self.encode(puzzle_start)
+        self.goal_code, self.goal_blank = self.encode(puzzle_goal)
+        self.solvable = self.is_solvable()
+        self.distance_table = self.heuristic_table()
+        self.pattern_databases = None
+        self.max_nodes = None
+        self.deadline = None
+        self.limited = False
+
+
+    '''
+    The size of the board is taken from the start file, so both boards have to
+    be square of that size and hold every tile from 0 to size * size - 1 once.
+    '''
+    def check_boards(self, puzzle_start, puzzle_goal):
+        cells = self.size * self.size
+        for name, board in (("start", puzzle_start), ("goal", puzzle_goal)):
+            if len(board) != self.size or any(len(row) != self.size for row in board):
+                raise ValueError(f"The {name} board is not {self.size}x{self.size} like the start board")
+            if sorted(tile for row in board for tile in row) != list(range(cells)):
+                raise ValueError(f"The {name} board has to hold the tiles 0 to {cells - 1} once each")
+
+    '''
+    Checking that the goal can be reached from the start at all. Every move
+    swaps the blank with a tile, which flips the parity of the permutation of
+    the cells and moves the blank by one cell, so the parity of the inversions
+    of the start against the goal, counting the blank, always matches the
+    parity of the distance between the two blank positions on a solvable pair.
+    On odd widths this is the usual rule that the tiles need the same number
+    of inversions modulo 2, on even widths the row of the blank comes in too.
+    The other half of the boards can never reach the goal, and the searches
+    return at once for them instead of exhausting the reachable half.
+    '''
+    def is_solvable(self):
+        goal_position = {tile: position for position, tile in enumerate(self.unpack(self.goal_code))}
+        order = [goal_position[tile] for tile in self.unpack(self.start_code)]
+        inversions = sum(1 for i in range(len(order)) for j in range(i + 1, len(order)) if order[i] > order[j])
+        distance = (abs(self.start_blank // self.size - self.goal_blank // self.size)
+                    + abs(self.start_blank % self.size - self.goal_blank % self.size))
+        return inversions % 2 == distance % 2
+
+    '''
+    Precomputing for every position of the blank the positions it can swap
+    with, in the same Right, Left, Down, Up order of the blank the search has
+    always used, so expanding a state never has to check the bounds again.
+    Each neighbour also carries the direction its tile travels into the blank.
+    '''
+    def neighbour_table(self):
+        moves = [((0, 1), 'Left'), ((0, -1), 'Right'), ((1, 0), 'Up'), ((-1, 0), 'Down')]
+        table = []
+        for x in range(self.size):
+            for y in range(self.size):
+                table.append([((x + i) * self.size + (y + j), direction) for (i, j), direction in moves
+                              if 0 <= x + i < self.size and 0 <= y + j < self.size])
+        return table
+
+    '''
+    Packing a board given as a list of rows into a single integer, every cell
+    taking cell_bits bits, and returning it along with the blank position.
+    This is the only form of the state the search methods store.
+    '''
+    def encode(self, state):
+        code = 0
+        blank = None
+        for position, tile in enumerate(tile for row in state for tile in row):
+            code |= tile << (position * self.cell_bits)
+            if tile == 0:
+                blank = position
+        return code, blank
+
+    '''
+    Unpacking an integer state back into the list of rows used at the input
+    and output boundary of the program.
+    '''
+    def decode(self, code):
+        return [[(code >> ((x * self.size + y) * self.cell_bits)) & self.cell_mask
+                 for y in range(self.size)] for x in range(self.size)]
+
+    '''
+    The tile on every cell of a packed state, in the order of the cells.
+    '''
+    def unpack(self, code):
+        return [(code >> (position * self.cell_bits)) & self.cell_mask for position in range(self.size * self.size)]
+
+    '''
+    Generating the successors of a packed state. The tile next to the blank is
+    moved by clearing it from its cell and writing it into the blank cell, so
+    no rows are copied. Returns the child state with its new blank position,
+    along with the tile that was moved and the direction it went.
+    '''
+    def expand(self, code, blank):
+        bits = self.cell_bits
+        children = []
+        for position, direction in self.neighbours[blank]:
+            tile = (code >> (position * bits)) & self.cell_mask
+            children.append((code - (tile << (position * bits)) + (tile << (blank * bits)), position, tile, direction))
+        return children
 
     '''
     Figuring out the legal moves that can be made in the puzzle such that we 
@@ -25,51 +752,174 @@ class Expense_Puzzle:
     items in the puzzle.
     '''
     def possible_moves(self, state):
-        zeros = [(i, j) for i in range(3) for j in range(3) if state[i][j] == 0]
-        x, y = next(iter(zeros))
-        moves = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-        valid_moves = []
-        for i, j in moves:
-            if 0 <= x + i < 3 and 0 <= y + j < 3:
-                new_state = [row.copy() for row in state]
-                new_state[x][y], new_state[x+i][y+j] = new_state[x+i][y+j], new_state[x][y]
-                valid_moves.append(new_state)
-        return valid_moves
+        code, blank = self.encode(state)
+        return [self.decode(child[0]) for child in self.expand(code, blank)]
+
+    '''
+    Giving the searches a budget of popped nodes and of seconds from now. Once
+    either is used up the search stops by raising Search_Limit_Reached.
+    '''
+    def set_limits(self, max_nodes=None, max_seconds=None):
+        self.max_nodes = max_nodes
+        self.deadline = time.monotonic() + max_seconds if max_seconds else None
+        self.limited = max_nodes is not None or self.deadline is not None
+
+    def check_limits(self):
+        if self.max_nodes is not None and self.nodes_popped > self.max_nodes:
+            raise Search_Limit_Reached(f"Node limit of {self.max_nodes} reached")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise Search_Limit_Reached("Time limit reached")
+
+    '''
+    Opening the search trace dump of a search. search_trace is either a flag,
+    in which case a text trace with the default settings is written, or a
+    Search_Trace that was set up with the format and sampling wanted.
+    '''
+    def start_trace(self, search_trace, title):
+        if not search_trace:
+            return None
+        trace = search_trace if isinstance(search_trace, Search_Trace) else Search_Trace()
+        return trace.open(self, title)
+
+    '''
+    Finishing the search trace dump, if there is one, with the final counters
+    and the solution, and returning what the search methods return: the name
+    of the trace file, the steps and the cost.
+    '''
+    def finish_trace(self, trace, steps, cost):
+        trace_filename = trace.finish(steps, cost) if trace else ""
+        return trace_filename, steps, cost
 
     '''
     As the output of the program requires to show the steps involved in acheiveing
     the goal state of the puzzle, we will grab that information and return it
-    along with the final cost.
+    along with the final cost. The path is given as the moved tile and the 
+    direction it went for every move from the start.
     '''
-    def get_output(self, states):
+    def get_output(self, path):
         total_cost = 0
         steps = []
-        for state in states:
-            for x in range(3):
-                for y in range(3):
-                    if state[x][y] < 0:
-                        value = abs(state[x][y])
-                        steps.extend([f"Move {value} {self.choose_direction(x, y, i, j)}"
-                                       for i in range(3) for j in range(3)
-                                       if state[i][j] > 0])
-                        total_cost += value
+        for tile, direction in path:
+            steps.append(f"Move {tile} {direction}")
+            total_cost += tile
 
         return total_cost, steps
 
     '''
-    This is a helper function used to figure out what step is taken in the puzzle
-    to store in the history of steps.
+    Walking the came from table back from a state to the start, every entry
+    holding the parent state and the move that led out of it, and returning
+    the moves in the order they were made. This is only done once the goal
+    has been popped, so no search node has to carry its own history.
     '''
-    def choose_direction(self, x, y, i, j):
-        if x == i:
-            return 'Left' if j > y else 'Right'
-        if y == j:
-            return 'Up' if i > x else 'Down'
-        return None
+    def path_from(self, came_from, code):
+        path = []
+        while came_from[code] is not None:
+            code, tile, direction = came_from[code]
+            path.append((tile, direction))
+        path.reverse()
+        return path
+
+    '''
+    The depth limited searches revisit states along different branches, so
+    rather than a table keyed by the state every fringe entry points at a
+    shared link of (parent link, tile, direction) and the path is rebuilt
+    by following those links.
+    '''
+    def path_from_link(self, link):
+        path = []
+        while link is not None:
+            link, tile, direction = link
+            path.append((tile, direction))
+        path.reverse()
+        return path
+
+    '''
+    Precomputing the heuristic for the goal of this puzzle once. The entry for
+    a tile at a position is its Manhattan distance to where it sits in the goal
+    multiplied by its value, so the heuristic of a state is a sum of lookups.
+    '''
+    def heuristic_table(self):
+        cells = self.size * self.size
+        goal_position = {tile: position for position, tile in enumerate(tile for row in self.puzzle_goal for tile in row)}
+        table = [[0] * cells for tile in range(max(goal_position) + 1)]
+        for tile, target in goal_position.items():
+            for position in range(cells):
+                distance = abs(position // self.size - target // self.size) + abs(position % self.size - target % self.size)
+                table[tile][position] = distance * tile
+        return table
+
+    '''
+    Splitting the tiles into the disjoint groups used for the pattern databases.
+    The tiles are taken in the order of their cells in the goal, so each group
+    sits together on the board and its tiles get in each other's way, which is
+    what the database captures. Groups of 4 are used up to the 15 puzzle and
+    groups of 3 above it, which keeps the table of the 24 puzzle quick to build.
+    '''
+    def default_patterns(self):
+        tiles = [tile for row in self.puzzle_goal for tile in row if tile != 0]
+        group = 4 if len(tiles) <= 15 else 3
+        return [tiles[i:i + group] for i in range(0, len(tiles), group)]
+
+    '''
+    Switching the heuristic of the searches over to the sum of additive pattern
+    databases for the goal, which is never below the weighted Manhattan
+    distance and usually far above it on hard instances. The tables are built
+    once per goal and kept in cache_dir, so later runs only map the files.
+    '''
+    def use_pattern_databases(self, patterns=None, cache_dir='pdb_cache'):
+        patterns = patterns or self.default_patterns()
+        self.pattern_databases = [Pattern_Database.for_goal(self.size, self.puzzle_goal, tiles, self.neighbours, cache_dir)
+                                  for tiles in patterns]
+        self.tile_pattern = {}
+        for database in self.pattern_databases:
+            for tile in database.tiles:
+                self.tile_pattern[tile] = database
+
+    '''
+    Finding the position of every tile in a packed state.
+    '''
+    def tile_positions(self, code):
+        where = [0] * (self.cell_mask + 1)
+        for position in range(self.size * self.size):
+            where[(code >> (position * self.cell_bits)) & self.cell_mask] = position
+        return where
+
+    '''
+    The heuristic of a packed state computed from the table in one pass.
+    '''
+    def state_heuristic(self, code):
+        if self.pattern_databases:
+            where = self.tile_positions(code)
+            return sum(database.lookup(where) for database in self.pattern_databases)
+        value = 0
+        for position in range(self.size * self.size):
+            value += self.distance_table[(code >> (position * self.cell_bits)) & self.cell_mask][position]
+        return value
+
+    '''
+    After a move only the moved tile changes its distance to the goal, so the
+    heuristic of the child is found from the heuristic of the parent by taking
+    out the old score of that tile and adding its new one. With the pattern
+    databases it is the same, only the database holding the moved tile is
+    looked up again, for the placement in the child state. A search that keeps
+    the position of every tile itself can pass it as where, which is left
+    with the tile at position_to.
+    '''
+    def move_heuristic(self, value, code, tile, position_from, position_to, where=None):
+        if self.pattern_databases:
+            database = self.tile_pattern[tile]
+            where = self.tile_positions(code) if where is None else where
+            where[tile] = position_from
+            old = database.lookup(where)
+            where[tile] = position_to
+            return value - old + database.lookup(where)
+        row = self.distance_table[tile]
+        return value - row[position_from] + row[position_to]
 
     '''
     Creating a heuristic to use for the A* and Greedy methods to adjust in the 
-    calculations of the cost.
+    calculations of the cost. This works on the list of rows for any goal,
+    the searches use the table above for the goal of the puzzle.
     '''
     def heuristic(self,start, goal):
         value = 0
@@ -82,203 +932,206 @@ class Expense_Puzzle:
         return value
     
     
-    def greedy(self, search_trace=False):
+    '''
+    This is the priority queue search shared by the UCS, Greedy and A* methods.
+    The priority of a state is g_weight times the cost of the moves taken to
+    reach it plus h_weight times its heuristic, every move costing the value of
+    the tile that was moved. The best known cost of every state is kept in 
+    best_g, so a state is only pushed again when it is reached more cheaply and
+    the older entries left behind in the heap are skipped when they are popped.
+    '''
+    def best_first(self, title, g_weight, h_weight, search_trace=False, checkpoint=None):
         self.nodes_generated += 1
-        trace_filename  = ""
         '''
-        Setting up the search trace dump file with its unique naming for further
-        use later on.
+        Setting up the search trace dump, which stays None when it is not asked for.
         '''
-        if search_trace:
-            time = datetime.datetime.now()
-            file_time = time.strftime('%Y%m%d-%H%M%S')
-            trace_filename = f"trace-{file_time}.txt"
-            trace_file = open(trace_filename, 'w')
-            trace_file.write("Greedy Algorithm \n")
-        
+        trace = self.start_trace(search_trace, f"{title} Algorithm")
+        if not self.solvable:
+            return self.finish_trace(trace, None, None)
+
         '''
         Initializing the fringe contents with the fringe properties and also
         initialzing closed states to not explore previous states again.
+        Every entry in the fringe is (cost, heuristic, state, blank), the
+        heuristic being carried so the children can update it.
         '''
-        fringe = []
-        heapq.heappush(fringe,((self.heuristic(self.puzzle_start, self.puzzle_goal), self.puzzle_start, [self.puzzle_start], 0)))
+        fringe = Priority_Frontier()
+        best_g = {self.start_code: 0}
+        came_from = {self.start_code: None}
         state_closed = {}
+        if checkpoint and checkpoint.exists():
+            table, entries = checkpoint.load(self, title)
+            for state, move, cost, closed in table:
+                came_from[state] = move
+                best_g[state] = cost
+                if closed:
+                    state_closed[state] = 1
+            for state, blank, _, cost, heuristic, priority in entries:
+                fringe.push((cost, heuristic, state, blank), priority)
+        else:
+            start_heuristic = self.state_heuristic(self.start_code)
+            fringe.push((0, start_heuristic, self.start_code, self.start_blank), h_weight * start_heuristic)
 
         while fringe:
             '''
-            Will be getting the contents of the fringe out and assign it to its
-            respective variables to use later.
+            Saving a checkpoint of the search when one is due, with the fringe
+            in the order it was pushed so ties come out the same way on resume.
             '''
-            fringe_contents = (heapq.heappop(fringe))
-            fringe_state, fringe_history, fringe_cost = fringe_contents[1:]
-            self.nodes_popped += 1
-            state_closed[str(fringe_state)] = 1
-            possible_moves = self.possible_moves(fringe_state)
-            
+            if checkpoint and checkpoint.due(self.nodes_popped):
+                checkpoint.save(self, title, [(state, move, best_g[state], state in state_closed)
+                                              for state, move in came_from.items()],
+                                [(state, blank, None, cost, heuristic, priority) for priority, _, (cost, heuristic, state, blank)
+                                 in sorted(fringe.entries, key=lambda entry: entry[1])])
+
             '''
-            Printing to the search trace file so we can keep track of our steps
-            to debug if neccesary and to just view if needed.
+            Will be getting the contents of the fringe out and skipping it if the
+            state was already closed or a cheaper way to it was found after this
+            entry was pushed.
             '''
-            if search_trace:
-                trace_file.write("------------------------\n")
-                trace_file.write(f"Fringe:\n{list(fringe)}\n")
-                trace_file.write(f"Closed States :\n{state_closed}\n")
-                trace_file.write(f"Nodes Expanded: {self.nodes_expanded}\n")
-                trace_file.write(f"Nodes Popped: {self.nodes_popped}\n")
-                trace_file.write(f"Nodes Generated: {self.nodes_generated}\n")
-            
+            fringe_cost, fringe_heuristic, fringe_state, fringe_blank = fringe.pop()
+            if fringe_state in state_closed or fringe_cost > best_g[fringe_state]:
+                continue
+            self.nodes_popped += 1
+            if self.limited:
+                self.check_limits()
+            state_closed[fringe_state] = 1
+
             '''
-            Checking if each state based on possible moves that can happen
-            in the puzzle have been performed before and if not, we will add that 
-            to our history so we can backtrack later.
-            We will also be updating the required puzzle properties.
+            Writing the pop and close of this state to the search trace dump so we
+            can keep track of our steps to debug if neccesary and to just view if needed.
             '''
-            for i in range(len(possible_moves)):
-                self.nodes_expanded += 1
-                if not state_closed.get(str(possible_moves[i])):
-                    total_cost = self.heuristic(possible_moves[i], self.puzzle_goal)
-                    heapq.heappush(fringe,((total_cost, possible_moves[i], fringe_history + [possible_moves[i]], fringe_cost + 1)))
-                    self.nodes_generated += 1
-                    self.max_fringe_size = len(fringe) if self.max_fringe_size < len(fringe) else self.max_fringe_size
-            
+            if trace:
+                trace.pop(fringe_state, fringe_cost, len(fringe), len(state_closed))
+                trace.close_state(fringe_state)
+
             '''
             Check if the fringe state matches the state of the goal that
             was given to us, and if so we will get the history of steps taken 
             to reach here and return that so users can receive their output.
+            Testing it when it is popped rather than when it is pushed is what
+            keeps the UCS and A* solutions the cheapest ones.
             '''
-            if fringe_state == self.puzzle_goal:
-                states = [[[(fringe_history[i][x][y] - fringe_history[i+1][x][y]) for y in range(3)] 
-                         for x in range(3)] for i in range(len(fringe_history)-1)]
-                final_cost, steps = self.get_output(states)
-                if search_trace:
-                    trace_file.write(f"Solution Found at depth {len(steps)} with cost of {final_cost}.")
-                    trace_file.close()
-                return trace_filename,steps, final_cost
+            if fringe_state == self.goal_code:
+                final_cost, steps = self.get_output(self.path_from(came_from, fringe_state))
+                return self.finish_trace(trace, steps, final_cost)
 
-        return None, None, None 
-        
-    def a_star(self, search_trace=False):
-        self.nodes_generated += 1
-        trace_filename  = ""
-        '''
-        Setting up the search trace dump file with its unique naming for further
-        use later on.
-        '''
-        if search_trace:
-            time = datetime.datetime.now()
-            file_time = time.strftime('%Y%m%d-%H%M%S')
-            trace_filename = f"trace-{file_time}.txt"
-            trace_file = open(trace_filename, 'w')
-            trace_file.write("A Star Algorithm \n")
-        
-        '''
-        Initializing the fringe contents with the fringe properties and also
-        initialzing closed states to not explore previous states again.
-        '''
-        fringe = []
-        heapq.heappush(fringe,((self.heuristic(self.puzzle_start, self.puzzle_goal), self.puzzle_start, [self.puzzle_start], 0)))
-        state_closed = {}
-        
-        while fringe:
-            '''
-            Will be getting the contents of the fringe out and assign it to its
-            respective variables to use later.
-            '''
-            fringe_contents = heapq.heappop(fringe)
-            fringe_state, fringe_history, fringe_cost = fringe_contents[1:]
-            self.nodes_popped += 1
-            state_closed[str(fringe_state)] = 1
-            possible_moves = self.possible_moves(fringe_state)
-            
             '''
-            Printing to the search trace file so we can keep track of our steps
-            to debug if neccesary and to just view if needed.
+            Pushing every successor that is not closed and is now reached more
+            cheaply than before, and pointing its came from entry at this state.
             '''
-            if search_trace:
-                trace_file.write("------------------------\n")
-                trace_file.write(f"Fringe:\n{list(fringe)}\n")
-                trace_file.write(f"Closed States :\n{state_closed}\n")
-                trace_file.write(f"Nodes Expanded: {self.nodes_expanded}\n")
-                trace_file.write(f"Nodes Popped: {self.nodes_popped}\n")
-                trace_file.write(f"Nodes Generated: {self.nodes_generated}\n")
-            
-            
-            '''
-            Checking if each state based on possible moves that can happen
-            in the puzzle have been performed before and if not, we will add that 
-            to our history so we can backtrack later.
-            We will also be updating the required puzzle properties.
-            '''
-            for i in range(len(possible_moves)):
+            for child_state, child_blank, tile, direction in self.expand(fringe_state, fringe_blank):
                 self.nodes_expanded += 1
-                if not state_closed.get(str(possible_moves[i])):
-                    total_cost = fringe_cost + 1 + self.heuristic(possible_moves[i], self.puzzle_goal)
-                    heapq.heappush(fringe,((total_cost, possible_moves[i], fringe_history + [possible_moves[i]], fringe_cost + 1)))
-                    self.nodes_generated += 1
-                    self.max_fringe_size = len(fringe) if self.max_fringe_size < len(fringe) else self.max_fringe_size
+                child_cost = fringe_cost + tile
+                if child_state in state_closed or child_cost >= best_g.get(child_state, child_cost + 1):
+                    continue
+                best_g[child_state] = child_cost
+                came_from[child_state] = (fringe_state, tile, direction)
+                child_heuristic = self.move_heuristic(fringe_heuristic, child_state, tile, child_blank, fringe_blank)
+                priority = g_weight * child_cost + h_weight * child_heuristic
+                fringe.push((child_cost, child_heuristic, child_state, child_blank), priority)
+                self.nodes_generated += 1
+                if trace:
+                    trace.push(child_state, child_cost)
+                self.max_fringe_size = len(fringe) if self.max_fringe_size < len(fringe) else self.max_fringe_size
 
-            '''
-            Check if the fringe state matches the state of the goal that
-            was given to us, and if so we will get the history of steps taken 
-            to reach here and return that so users can receive their output.
-            '''        
-            if fringe_state == self.puzzle_goal:
-                states = [[[(fringe_history[i][x][y] - fringe_history[i+1][x][y]) for y in range(3)] 
-                         for x in range(3)] for i in range(len(fringe_history)-1)]
-                
-                final_cost, steps = self.get_output(states)
-                if search_trace:
-                    trace_file.write(f"Solution Found at depth {len(steps)} with cost of {final_cost}.")
-                    trace_file.close()
-        
-                return trace_filename,steps, final_cost
+        return self.finish_trace(trace, None, None)
 
-        return None, None, None 
-    
-    def bfs(self, search_trace=False):
+    '''
+    Solving the puzzle by walking the precomputed solution table of its goal,
+    which is built on the first use for a goal and loaded from cache_dir on
+    every run after that. No node is searched, so the counters stay at zero.
+    '''
+    def table_solve(self, search_trace=False, cache_dir='pdb_cache'):
+        trace = self.start_trace(search_trace, "Solution Table")
+        if not self.solvable:
+            return self.finish_trace(trace, None, None)
+        path = Solution_Table.for_goal(self, cache_dir).walk(self)
+        if path is None:
+            return self.finish_trace(trace, None, None)
+        final_cost, steps = self.get_output(path)
+        return self.finish_trace(trace, steps, final_cost)
+
+    '''
+    Greedy only looks at the heuristic of a state to pick what to expand next.
+    '''
+    def greedy(self, search_trace=False, checkpoint=None):
+        return self.best_first("Greedy", 0, 1, search_trace, checkpoint)
+
+    '''
+    A* orders the fringe by the cost so far plus the heuristic. Both heuristics
+    are consistent: a move of a tile changes its weighted Manhattan distance by
+    the value of the tile, and changes the pattern database of its group by at
+    most that, since the tables are built over moves of the pattern tiles alone.
+    So a state is never closed on a costlier path than its cheapest, which
+    best_first relies on as it never reopens one, and the first time the goal
+    is popped its cost is the cheapest.
+    '''
+    def a_star(self, search_trace=False, checkpoint=None):
+        return self.best_first("A Star", 1, 1, search_trace, checkpoint)
+
+    '''
+    BFS and DFS are the same search on a different frontier, a FIFO one for
+    BFS and a LIFO one for DFS. The goal is tested when a state is popped,
+    or with early_goal_test as soon as it is generated, which saves
+    expanding the last layer of BFS and still finds the shallowest goal.
+    '''
+    def fringe_search(self, title, fringe, search_trace=False, early_goal_test=False, checkpoint=None):
         self.nodes_generated += 1
-        trace_filename  = ""
         '''
-        Setting up the search trace dump file with its unique naming for further
-        use later on.
+        Setting up the search trace dump, which stays None when it is not asked for.
         '''
-        if search_trace:
-            time = datetime.datetime.now()
-            file_time = time.strftime('%Y%m%d-%H%M%S')
-            trace_filename = f"trace-{file_time}.txt"
-            trace_file = open(trace_filename, 'w')
-            trace_file.write("BFS Algorithm \n")
+        trace = self.start_trace(search_trace, f"{title} Algorithm")
+        if not self.solvable:
+            return self.finish_trace(trace, None, None)
         
         '''
         Initializing the fringe contents with the fringe properties and also
         initialzing closed states to not explore previous states again.
         '''
-        fringe = []
-        fringe.append((self.puzzle_start, [self.puzzle_start]))
         state_closed = {}
+        came_from = {}
+        if checkpoint and checkpoint.exists():
+            table, entries = checkpoint.load(self, title)
+            for state, move, _, _ in table:
+                came_from[state] = move
+                state_closed[state] = 1
+            for state, blank, move, _, _, _ in entries:
+                fringe.push((state, blank) + (move or (None, None, None)))
+        else:
+            fringe.push((self.start_code, self.start_blank, None, None, None))
         
         while fringe:
+            '''
+            Saving a checkpoint of the search when one is due. Only the popped
+            states are in the came from table, the fringe keeps the move that
+            reached each of its states.
+            '''
+            if checkpoint and checkpoint.due(self.nodes_popped):
+                checkpoint.save(self, title, [(state, move, 0, True) for state, move in came_from.items()],
+                                [(state, blank, None if parent is None else (parent, tile, direction), 0, 0, 0)
+                                 for state, blank, parent, tile, direction in fringe.entries])
+
             '''
             Will be getting the contents of the fringe out and assign it to its
             respective variables to use later.
             '''
-            fringe_contents = fringe.pop(0)
-            fringe_state,fringe_history = fringe_contents[0:]
+            fringe_contents = fringe.pop()
+            fringe_state, fringe_blank, *fringe_move = fringe_contents[0:]
             self.nodes_popped += 1
-            state_closed[str(fringe_state)] = 1
-            possible_moves = self.possible_moves(fringe_state)
+            if self.limited:
+                self.check_limits()
+            state_closed[fringe_state] = 1
+            if fringe_state not in came_from:
+                came_from[fringe_state] = None if fringe_move[0] is None else tuple(fringe_move)
+            possible_moves = self.expand(fringe_state, fringe_blank)
             
             '''
-            Printing to the search trace file so we can keep track of our steps
-            to debug if neccesary and to just view if needed.
+            Writing the pop and close of this state to the search trace dump so we
+            can keep track of our steps to debug if neccesary and to just view if needed.
             '''
-            if search_trace:
-                trace_file.write("------------------------\n")
-                trace_file.write(f"Fringe:\n{list(fringe)}\n")
-                trace_file.write(f"Closed States :\n{state_closed}\n")
-                trace_file.write(f"Nodes Expanded: {self.nodes_expanded}\n")
-                trace_file.write(f"Nodes Popped: {self.nodes_popped}\n")
-                trace_file.write(f"Nodes Generated: {self.nodes_generated}\n")
+            if trace:
+                trace.pop(fringe_state, None, len(fringe), len(state_closed))
+                trace.close_state(fringe_state)
             
             '''
             Checking if each state based on possible moves that can happen
@@ -288,9 +1141,17 @@ class Expense_Puzzle:
             '''
             for i in range(len(possible_moves)):
                 self.nodes_expanded += 1
-                if not state_closed.get(str(possible_moves[i])):
-                    fringe.append((possible_moves[i], fringe_history + [possible_moves[i]]))
+                child_state, child_blank, tile, direction = possible_moves[i]
+                if not state_closed.get(child_state):
+                    if early_goal_test and child_state == self.goal_code:
+                        self.nodes_generated += 1
+                        path = self.path_from(came_from, fringe_state) + [(tile, direction)]
+                        final_cost, steps = self.get_output(path)
+                        return self.finish_trace(trace, steps, final_cost)
+                    fringe.push((child_state, child_blank, fringe_state, tile, direction))
                     self.nodes_generated += 1
+                    if trace:
+                        trace.push(child_state)
                     self.max_fringe_size = len(fringe) if self.max_fringe_size < len(fringe) else self.max_fringe_size
 
                         
@@ -299,318 +1160,668 @@ class Expense_Puzzle:
             was given to us, and if so we will get the history of steps taken 
             to reach here and return that so users can receive their output.
             '''            
-            if fringe_state == self.puzzle_goal:
-                states = [[[(fringe_history[i][x][y] - fringe_history[i+1][x][y]) for y in range(3)] 
-                         for x in range(3)] for i in range(len(fringe_history)-1)]
-                final_cost, steps = self.get_output(states)
-                if search_trace:
-                    trace_file.write(f"Solution Found at depth {len(steps)} with cost of {final_cost}.")
-                    trace_file.close()
-                return trace_filename, steps, final_cost
+            if fringe_state == self.goal_code:
+                final_cost, steps = self.get_output(self.path_from(came_from, fringe_state))
+                return self.finish_trace(trace, steps, final_cost)
             
-        return None, None, None 
+        return self.finish_trace(trace, None, None)
     
     
-    def ucs(self, search_trace=False):
-        self.nodes_generated += 1
-        trace_filename  = ""
-        '''
-        Setting up the search trace dump file with its unique naming for further
-        use later on.
-        '''
-        if search_trace:
-            time = datetime.datetime.now()
-            file_time = time.strftime('%Y%m%d-%H%M%S')
-            trace_filename = f"trace-{file_time}.txt"
-            trace_file = open(trace_filename, 'w')
-            trace_file.write("UCS Algorithm \n")
-        
-        '''
-        Initializing the fringe contents with the fringe properties and also
-        initialzing closed states to not explore previous states again.
-        '''
-        fringe = []
-        heapq.heappush(fringe,((0, self.puzzle_start, [self.puzzle_start], 0)))
-        state_closed = {}
+    def bfs(self, search_trace=False, early_goal_test=False, checkpoint=None):
+        return self.fringe_search("BFS", FIFO_Frontier(), search_trace, early_goal_test, checkpoint)
 
-        while fringe:
-            '''
-            Will be getting the contents of the fringe out and assign it to its
-            respective variables to use later.
-            '''
-            fringe_contents = heapq.heappop(fringe)
-            fringe_state, fringe_history, fringe_cost = fringe_contents[1:]
+    def dfs(self, search_trace=False, early_goal_test=False, checkpoint=None):
+        return self.fringe_search("DFS", LIFO_Frontier(), search_trace, early_goal_test, checkpoint)
 
+    '''
+    UCS orders the fringe by the cost of the moves taken so far only.
+    '''
+    def ucs(self, search_trace=False, checkpoint=None):
+        return self.best_first("UCS", 1, 0, search_trace, checkpoint)
+
+    '''
+    Bidirectional BFS grows one layer at a time from the start and from the 
+    goal, always the side with the smaller frontier, and stops at the end of
+    the first layer that reaches a state already seen from the other side. The
+    whole layer is finished so the meeting state on the fewest moves is used.
+    Every side keeps its own came from table of (parent, tile, direction, depth).
+    '''
+    def bidirectional_bfs(self, search_trace=False):
+        self.nodes_generated += 2
+        trace = self.start_trace(search_trace, "Bidirectional BFS Algorithm")
+        if not self.solvable:
+            return self.finish_trace(trace, None, None)
+
+        fringe = {'forward': [(self.start_code, self.start_blank)], 'backward': [(self.goal_code, self.goal_blank)]}
+        came_from = {'forward': {self.start_code: None}, 'backward': {self.goal_code: None}}
+        depth = {'forward': {self.start_code: 0}, 'backward': {self.goal_code: 0}}
+        meet = self.start_code if self.start_code == self.goal_code else None
+
+        while meet is None and fringe['forward'] and fringe['backward']:
+            side = 'forward' if len(fringe['forward']) <= len(fringe['backward']) else 'backward'
+            other = 'backward' if side == 'forward' else 'forward'
+            next_layer = []
+            best_meet = None
+            for fringe_state, fringe_blank in fringe[side]:
+                self.nodes_popped += 1
+                if self.limited:
+                    self.check_limits()
+                if trace:
+                    trace.pop(fringe_state, depth[side][fringe_state], len(fringe[side]) + len(fringe[other]), len(came_from[side]) + len(came_from[other]))
+                for child_state, child_blank, tile, direction in self.expand(fringe_state, fringe_blank):
+                    self.nodes_expanded += 1
+                    if child_state in came_from[side]:
+                        continue
+                    came_from[side][child_state] = (fringe_state, tile, direction)
+                    depth[side][child_state] = depth[side][fringe_state] + 1
+                    next_layer.append((child_state, child_blank))
+                    self.nodes_generated += 1
+                    if trace:
+                        trace.push(child_state, depth[side][child_state])
+                    if child_state in depth[other]:
+                        total = depth[side][child_state] + depth[other][child_state]
+                        if best_meet is None or total < best_meet[0]:
+                            best_meet = (total, child_state)
+            fringe[side] = next_layer
+            fringe_size = len(fringe['forward']) + len(fringe['backward'])
+            self.max_fringe_size = fringe_size if self.max_fringe_size < fringe_size else self.max_fringe_size
+
+            if best_meet is not None:
+                meet = best_meet[1]
+
+        return self.bidirectional_output(trace, came_from, meet)
+
+    '''
+    Bidirectional UCS runs a Dijkstra from the start and one from the goal,
+    which is sound since a move and its reverse cost the same tile value. Every
+    time a state is reached that the other side has a cost for, the cheapest
+    such total is kept. The search can stop once the smallest costs left in the
+    two fringes add up to at least that total, since any path not seen yet
+    would have to cost more.
+    '''
+    def bidirectional_ucs(self, search_trace=False):
+        self.nodes_generated += 2
+        trace = self.start_trace(search_trace, "Bidirectional UCS Algorithm")
+        if not self.solvable:
+            return self.finish_trace(trace, None, None)
+
+        order = itertools.count()
+        fringe = {'forward': [(0, next(order), self.start_code, self.start_blank)],
+                  'backward': [(0, next(order), self.goal_code, self.goal_blank)]}
+        best_g = {'forward': {self.start_code: 0}, 'backward': {self.goal_code: 0}}
+        came_from = {'forward': {self.start_code: None}, 'backward': {self.goal_code: None}}
+        state_closed = {'forward': {}, 'backward': {}}
+        meet = self.start_code if self.start_code == self.goal_code else None
+        meet_cost = 0 if meet is not None else math.inf
+
+        while fringe['forward'] and fringe['backward']:
+            if fringe['forward'][0][0] + fringe['backward'][0][0] >= meet_cost:
+                break
+            side = 'forward' if len(fringe['forward']) <= len(fringe['backward']) else 'backward'
+            other = 'backward' if side == 'forward' else 'forward'
+            fringe_cost, _, fringe_state, fringe_blank = heapq.heappop(fringe[side])
+            if fringe_state in state_closed[side] or fringe_cost > best_g[side][fringe_state]:
+                continue
             self.nodes_popped += 1
-            state_closed[str(fringe_state)] = 1
-            possible_moves = self.possible_moves(fringe_state)
-            
-            '''
-            Printing to the search trace file so we can keep track of our steps
-            to debug if neccesary and to just view if needed.
-            '''
-            if search_trace:
-                trace_file.write("------------------------\n")
-                trace_file.write(f"Fringe:\n{list(fringe)}\n")
-                trace_file.write(f"Closed States :\n{state_closed}\n")
-                trace_file.write(f"Nodes Expanded: {self.nodes_expanded}\n")
-                trace_file.write(f"Nodes Popped: {self.nodes_popped}\n")
-                trace_file.write(f"Nodes Generated: {self.nodes_generated}\n")
+            if self.limited:
+                self.check_limits()
+            state_closed[side][fringe_state] = 1
 
-            '''
-            Checking if each state based on possible moves that can happen
-            in the puzzle have been performed before and if not, we will add that 
-            to our history so we can backtrack later.
-            We will also be updating the required puzzle properties.
-            '''
-            for i in range(len(possible_moves)):
+            if trace:
+                trace.pop(fringe_state, fringe_cost, len(fringe[side]) + len(fringe[other]), len(state_closed[side]) + len(state_closed[other]))
+                trace.close_state(fringe_state)
+
+            for child_state, child_blank, tile, direction in self.expand(fringe_state, fringe_blank):
                 self.nodes_expanded += 1
-                if not state_closed.get(str(possible_moves[i])):
-                    total_cost = fringe_cost + 1
-                    heapq.heappush(fringe,((total_cost, possible_moves[i], fringe_history + [possible_moves[i]], fringe_cost + 1)))
+                child_cost = fringe_cost + tile
+                if child_state in state_closed[side]:
+                    continue
+                if child_cost < best_g[side].get(child_state, child_cost + 1):
+                    best_g[side][child_state] = child_cost
+                    came_from[side][child_state] = (fringe_state, tile, direction)
+                    heapq.heappush(fringe[side], (child_cost, next(order), child_state, child_blank))
                     self.nodes_generated += 1
-                    self.max_fringe_size = len(fringe) if self.max_fringe_size < len(fringe) else self.max_fringe_size
+                    if trace:
+                        trace.push(child_state, child_cost)
+                    if child_state in best_g[other] and child_cost + best_g[other][child_state] < meet_cost:
+                        meet_cost = child_cost + best_g[other][child_state]
+                        meet = child_state
+            fringe_size = len(fringe['forward']) + len(fringe['backward'])
+            self.max_fringe_size = fringe_size if self.max_fringe_size < fringe_size else self.max_fringe_size
 
-                        
-            '''
-            Check if the fringe state matches the state of the goal that
-            was given to us, and if so we will get the history of steps taken 
-            to reach here and return that so users can receive their output.
-            '''          
-            if fringe_state == self.puzzle_goal:
-                states = [[[(fringe_history[i][x][y] - fringe_history[i+1][x][y]) for y in range(3)] 
-                         for x in range(3)] for i in range(len(fringe_history)-1)]
-                final_cost, steps = self.get_output(states)
-                if search_trace:
-                    trace_file.write(f"Solution Found at depth {len(steps)} with cost of {final_cost}.")
-                    trace_file.close()
-                return trace_filename, steps, final_cost
-
-        return None, None, None 
-    
-    def dfs(self, search_trace=False):
+        return self.bidirectional_output(trace, came_from, meet)
+
+    '''
+    Joining the two halves of a bidirectional search at the meeting state. The
+    moves from the start come from the forward table as usual, the backward
+    table is walked from the meeting state to the goal with every move turned
+    around, since it was recorded going away from the goal.
+    '''
+    def bidirectional_output(self, trace, came_from, meet):
+        if meet is None:
+            return self.finish_trace(trace, None, None)
+        opposite = {'Left': 'Right', 'Right': 'Left', 'Up': 'Down', 'Down': 'Up'}
+        path = self.path_from(came_from['forward'], meet)
+        code = meet
+        while came_from['backward'][code] is not None:
+            code, tile, direction = came_from['backward'][code]
+            path.append((tile, opposite[direction]))
+        final_cost, steps = self.get_output(path)
+        return self.finish_trace(trace, steps, final_cost)
+
+    '''
+    DLS and IDS share one depth limited pass: a depth first search on a LIFO
+    fringe that only expands states at most limit moves deep. Every fringe
+    entry keeps a link to the move that reached it, so the path is rebuilt
+    from the links instead of a came from table. The pass returns the final
+    cost and steps, or None when no state within the limit is the goal.
+    '''
+    def depth_limited_pass(self, limit, trace):
         self.nodes_generated += 1
-        '''
-        Initializing the fringe contents with the fringe properties and also
-        initialzing closed states to not explore previous states again.
-        Also getting the search trace buffer set up for later processing.
-        '''
-        trace_buffer =  []
-        if search_trace:
-            trace_buffer.append("DFS Algorithm \n")
-        fringe = []
-        fringe.append((self.puzzle_start, [self.puzzle_start]))
-        state_closed = {}
-        counter = 0
-        
+        fringe = LIFO_Frontier()
+        fringe.push((self.start_code, self.start_blank, 0, None))
+
         while fringe:
             '''
             Will be getting the contents of the fringe out and assign it to its
             respective variables to use later.
             '''
-            fringe_contents = fringe.pop()
-            fringe_state,fringe_history = fringe_contents[0:]
-        
+            fringe_state, fringe_blank, fringe_depth, fringe_link = fringe.pop()
             self.nodes_popped += 1
-            state_closed[str(fringe_state)] = 1
-            possible_moves = self.possible_moves(fringe_state)
-            
+            if self.limited:
+                self.check_limits()
             '''
-            Setting up the search trace dump file buffer so that the search trace 
-            can be added to this and later printed as this will be more efficient
-            method since this algorithm will take a lot of time.
-            Keeping the count to 50 to limit amount of printing and to be faster.
+            Writing the pop of this state to the search trace dump, which is
+            streamed and sampled rather than buffered as this algorithm will take
+            a lot of time.
             '''
-            if search_trace and counter <= 50:
-                trace_buffer.append("------------------------\n")
-                trace_buffer.append(f"Fringe:\n{list(fringe)}\n")
-                trace_buffer.append(f"Closed States :\n{state_closed}\n")
-                trace_buffer.append(f"Nodes Expanded: {self.nodes_expanded}\n")
-                trace_buffer.append(f"Nodes Popped: {self.nodes_popped}\n")
-                trace_buffer.append(f"Nodes Generated: {self.nodes_generated}\n")
-                
+            if trace:
+                trace.pop(fringe_state, None, len(fringe), 0)
+
             '''
-            Checking if each state based on possible moves that can happen
-            in the puzzle have been performed before and if not, we will add that 
-            to our history so we can backtrack later.
-            We will also be updating the required puzzle properties.
+            Making sure depth stays within limits, and pushing every move out of
+            the state with a link back to the move that reached it.
             '''
-            for i in range(len(possible_moves)):
-                self.nodes_expanded += 1
-                if not state_closed.get(str(possible_moves[i])):
-                    fringe.append((possible_moves[i], fringe_history + [possible_moves[i]]))
+            if fringe_depth <= limit:
+                for child_state, child_blank, tile, direction in self.expand(fringe_state, fringe_blank):
+                    self.nodes_expanded += 1
+                    fringe.push((child_state, child_blank, fringe_depth + 1, (fringe_link, tile, direction)))
                     self.nodes_generated += 1
+                    if trace:
+                        trace.push(child_state)
                     self.max_fringe_size = len(fringe) if self.max_fringe_size < len(fringe) else self.max_fringe_size
 
-            
             '''
             Check if the fringe state matches the state of the goal that
             was given to us, and if so we will get the history of steps taken 
             to reach here and return that so users can receive their output.
-            '''         
-            if fringe_state == self.puzzle_goal:
-                states = [[[(fringe_history[i][x][y] - fringe_history[i+1][x][y]) for y in range(3)] 
-                         for x in range(3)] for i in range(len(fringe_history)-1)]
-                final_cost, steps = self.get_output(states)
-                if search_trace and counter <= 50:
-                    trace_buffer.append(f"Solution Found at depth {len(steps)} with cost of {final_cost}.")
-                return trace_buffer, steps, final_cost
-            counter += 1
-            
-        return None, None, None 
-    
+            '''
+            if fringe_state == self.goal_code:
+                return self.get_output(self.path_from_link(fringe_link))
+
+        return None
+
     def dls(self, limit, search_trace=False):
+        trace = self.start_trace(search_trace, "DLS Algorithm")
+        if not self.solvable:
+            return self.finish_trace(trace, None, None)
+        found = self.depth_limited_pass(limit, trace)
+        if found is None:
+            return self.finish_trace(trace, None, None)
+        final_cost, steps = found
+        return self.finish_trace(trace, steps, final_cost)
+
+    '''
+    IDS runs the depth limited pass with a limit of 0, 1, 2, ... until one
+    finds the goal, which it always does since the puzzle is solvable.
+    '''
+    def ids(self, search_trace=False):
+        trace = self.start_trace(search_trace, "IDS Algorithm")
+        if not self.solvable:
+            return self.finish_trace(trace, None, None)
+        depth = 0
+        while True:
+            found = self.depth_limited_pass(depth, trace)
+            if found is not None:
+                final_cost, steps = found
+                return self.finish_trace(trace, steps, final_cost)
+            depth += 1
+
+    '''
+    IDA* runs depth first searches bounded by the cost plus the heuristic of a
+    node rather than by its depth, raising the bound every iteration to the
+    smallest value that went over it. Only the current path is ever stored:
+    the moves are made and undone on one board, the packed state and the
+    heuristic are updated along with it, and a child is skipped if it is
+    already on the path.
+    '''
+    def ida_star(self, search_trace=False):
         self.nodes_generated += 1
-        '''
-        Initializing the fringe contents with the fringe properties and also
-        initialzing closed states to not explore previous states again.
-        Also getting the search trace buffer set up for later processing.
-        '''
-        trace_buffer = []
-        if search_trace:
-            trace_buffer.append("DLS Algorithm \n")
-        fringe = []
-        fringe.append((self.puzzle_start, [self.puzzle_start],0))
-        state_closed = {}
-    
-        while fringe:
-            '''
-            Will be getting the contents of the fringe out and assign it to its
-            respective variables to use later.
-            '''
-            fringe_contents = fringe.pop()
-            fringe_state,fringe_history,fringe_depth = fringe_contents[0:]
-            
+        trace = self.start_trace(search_trace, "IDA* Algorithm")
+        if not self.solvable:
+            return self.finish_trace(trace, None, None)
+
+        bits = self.cell_bits
+        board = self.unpack(self.start_code)
+        where = self.tile_positions(self.start_code)
+        path = []
+        on_path = {self.start_code}
+
+        def search(code, blank, cost, value, threshold):
             self.nodes_popped += 1
-            
+            if self.limited:
+                self.check_limits()
+            if trace:
+                trace.pop(code, cost, len(path), 0)
+            if cost + value > threshold:
+                return cost + value
+            if code == self.goal_code:
+                return True
+            minimum = math.inf
+            for position, direction in self.neighbours[blank]:
+                self.nodes_expanded += 1
+                tile = board[position]
+                child = code - (tile << (position * bits)) + (tile << (blank * bits))
+                if child in on_path:
+                    continue
+                child_value = self.move_heuristic(value, child, tile, position, blank, where)
+                board[blank], board[position] = tile, 0
+                where[tile] = blank
+                on_path.add(child)
+                path.append((tile, direction))
+                self.nodes_generated += 1
+                self.max_fringe_size = len(path) if self.max_fringe_size < len(path) else self.max_fringe_size
+                if trace:
+                    trace.push(child, cost + tile)
+                result = search(child, position, cost + tile, child_value, threshold)
+                if result is True:
+                    return True
+                board[position], board[blank] = tile, 0
+                where[tile] = position
+                on_path.remove(child)
+                path.pop()
+                minimum = result if result < minimum else minimum
+            return minimum
+
+        start_value = self.state_heuristic(self.start_code)
+        threshold = start_value
+        while True:
+            result = search(self.start_code, self.start_blank, 0, start_value, threshold)
+            if result is True:
+                final_cost, steps = self.get_output(path)
+                return self.finish_trace(trace, steps, final_cost)
+            if result == math.inf:
+                return self.finish_trace(trace, None, None)
+            threshold = result
+
+    '''
+    A simplified memory bounded A* that never keeps more than node_limit nodes.
+    It works like A*, deepest node first among equal f, but when memory is full
+    the shallowest leaf with the highest f is forgotten and its f is backed up
+    into its parent, which goes back into the fringe so that branch can be
+    regenerated if it becomes the best again. Children take at least the f of
+    their parent, and a node too deep for the remaining memory gets an infinite
+    f. Duplicates are only checked against the node's own ancestors. The max
+    fringe size reported is the most nodes that were in memory at once.
+    '''
+    def sma_star(self, node_limit=100000, search_trace=False):
+        if node_limit < 2:
+            raise ValueError("The node limit of SMA* has to be at least 2")
+        self.nodes_generated += 1
+        trace = self.start_trace(search_trace, f"SMA* Algorithm with a limit of {node_limit} nodes")
+        if not self.solvable:
+            return self.finish_trace(trace, None, None)
+
+        order = itertools.count()
+        best_fringe = []
+        worst_fringe = []
+        memory = 1
+
+        def open_node(node):
+            node.in_open = True
+            heapq.heappush(best_fringe, (node.f, -node.depth, next(order), node))
+            heapq.heappush(worst_fringe, (-node.f, node.depth, next(order), node))
+
+        def forget(node):
+            parent = node.parent
+            node.alive = False
+            node.in_open = False
+            del parent.children[node.code]
+            parent.forgotten[node.code] = node.f
+            parent.f = min(parent.forgotten.values())
+            open_node(parent)
+
+        start_value = self.state_heuristic(self.start_code)
+        root = Search_Node(self.start_code, self.start_blank, 0, start_value, start_value, 0)
+        open_node(root)
+
+        while best_fringe:
+            f, _, _, node = heapq.heappop(best_fringe)
+            if not node.in_open or not node.alive or f != node.f:
+                continue
+            node.in_open = False
+            if node.f == math.inf:
+                break
+            self.nodes_popped += 1
+            if self.limited:
+                self.check_limits()
+
+            if trace:
+                trace.pop(node.code, node.g, len(best_fringe), memory)
+
+            if node.code == self.goal_code:
+                path = []
+                while node.parent is not None:
+                    path.append((node.tile, node.direction))
+                    node = node.parent
+                path.reverse()
+                final_cost, steps = self.get_output(path)
+                return self.finish_trace(trace, steps, final_cost)
+
             '''
-            Making sure depth stays within limits
+            Generating the successors that are not in memory already, which
+            after the node was opened again are the ones that were forgotten.
             '''
-            if fringe_depth <= limit:
-                possible_moves = self.possible_moves(fringe_state)
-                '''
-                Setting up the search trace dump file buffer so that the search trace 
-                can be added to this and later printed as this will be more efficient
-                method since this algorithm will take a lot of time.
-                Keeping the count to 50 to limit amount of printing and to be faster.
-                '''
-                if search_trace:
-                    trace_buffer.append("------------------------\n")
-                    trace_buffer.append(f"Fringe:\n{list(fringe)}\n")
-                    trace_buffer.append(f"Closed States :\n{state_closed}\n")
-                    trace_buffer.append(f"Nodes Expanded: {self.nodes_expanded}\n")
-                    trace_buffer.append(f"Nodes Popped: {self.nodes_popped}\n")
-                    trace_buffer.append(f"Nodes Generated: {self.nodes_generated}\n")
-                
-                '''
-                Checking if each state based on possible moves that can happen
-                in the puzzle have been performed before and if not, we will add that 
-                to our history so we can backtrack later.
-                We will also be updating the required puzzle properties.
-                '''    
-                for i in range(len(possible_moves)):
-                    self.nodes_expanded += 1
-                    if not state_closed.get(str(possible_moves[i])):
-                        fringe.append((possible_moves[i], fringe_history + [possible_moves[i]],fringe_depth+1))
-                        self.nodes_generated += 1
-                        self.max_fringe_size = len(fringe) if self.max_fringe_size < len(fringe) else self.max_fringe_size
+            ancestors = set()
+            ancestor = node.parent
+            while ancestor is not None:
+                ancestors.add(ancestor.code)
+                ancestor = ancestor.parent
+            for child_state, child_blank, tile, direction in self.expand(node.code, node.blank):
+                self.nodes_expanded += 1
+                if child_state in ancestors or child_state in node.children:
+                    continue
+                child_cost = node.g + tile
+                child_value = self.move_heuristic(node.value, child_state, tile, child_blank, node.blank)
+                if child_state != self.goal_code and node.depth + 1 >= node_limit - 1:
+                    child_f = math.inf
+                else:
+                    child_f = max(node.f, child_cost + child_value, node.forgotten.pop(child_state, 0))
+                child = Search_Node(child_state, child_blank, child_cost, child_value, child_f, node.depth + 1, node, tile, direction)
+                node.children[child_state] = child
+                open_node(child)
+                memory += 1
+                self.nodes_generated += 1
+                if trace:
+                    trace.push(child_state, child_cost)
+            node.forgotten.clear()
 
             '''
-            Check if the fringe state matches the state of the goal that
-            was given to us, and if so we will get the history of steps taken 
-            to reach here and return that so users can receive their output.
-            '''    
-            if fringe_state == self.puzzle_goal:
-                states = [[[(fringe_history[i][x][y] - fringe_history[i+1][x][y]) for y in range(3)] 
-                         for x in range(3)] for i in range(len(fringe_history)-1)]
-                final_cost, steps = self.get_output(states)
-                if search_trace:
-                    trace_buffer.append(f"Solution Found at depth {len(steps)} with cost of {final_cost}.")
-                return trace_buffer,steps, final_cost
-            
-            
-        return None,None, None 
-    
-    
-    def ids(self,search_trace=False):
-        '''
-        Getting the search trace buffer set up for later processing.
-        Intializing depth at zero to start process.
-        '''
-        trace_buffer =  []
-        if search_trace:
-            trace_buffer.append("IDS Algorithm \n")
-        depth = 0
-        
-        while True:
-            self.nodes_generated += 1
+            A node that ends up with no children at all is a dead end.
             '''
-            Initializing the fringe contents with the fringe properties and also
-            initialzing closed states to not explore previous states again.
+            if not node.children and node.parent is not None:
+                node.f = math.inf
+                forget(node)
+                memory -= 1
+
             '''
-            fringe = []
-            fringe.append((self.puzzle_start, [self.puzzle_start],0))
-            state_closed = {}
-            
-            while fringe:
-                '''
-                Will be getting the contents of the fringe out and assign it to its
-                respective variables to use later.
-                '''
-                fringe_contents = fringe.pop()
-                fringe_state,fringe_history,fringe_depth = fringe_contents[0:]
-                
-                self.nodes_popped += 1
-                '''
-                Setting up the search trace dump file buffer so that the search trace 
-                can be added to this and later printed as this will be more efficient
-                method since this algorithm will take a lot of time.
-                Keeping the count to 50 to limit amount of printing and to be faster.
-                '''
-                if search_trace:
-                    trace_buffer.append("------------------------\n")
-                    trace_buffer.append(f"Fringe:\n{list(fringe)}\n")
-                    trace_buffer.append(f"Closed States :\n{state_closed}\n")
-                    trace_buffer.append(f"Nodes Expanded: {self.nodes_expanded}\n")
-                    trace_buffer.append(f"Nodes Popped: {self.nodes_popped}\n")
-                    trace_buffer.append(f"Nodes Generated: {self.nodes_generated}\n")
-                
-                '''
-                Making sure depth stays within limits
-                '''
-                if fringe_depth <= depth:
-                    possible_moves = self.possible_moves(fringe_state)
-                    '''
-                    Checking if each state based on possible moves that can happen
-                    in the puzzle have been performed before and if not, we will add that 
-                    to our history so we can backtrack later.
-                    We will also be updating the required puzzle properties.
-                    '''    
-                    for i in range(len(possible_moves)):
-                        self.nodes_expanded += 1
-                        if not state_closed.get(str(possible_moves[i])):
-                            fringe.append((possible_moves[i], fringe_history + [possible_moves[i]],fringe_depth+1))
-                            self.nodes_generated += 1
-                            self.max_fringe_size = len(fringe) if self.max_fringe_size < len(fringe) else self.max_fringe_size
-                
-                '''
-                Check if the fringe state matches the state of the goal that
-                was given to us, and if so we will get the history of steps taken 
-                to reach here and return that so users can receive their output.
-                ''' 
-                if fringe_state == self.puzzle_goal:
-                    states = [[[(fringe_history[i][x][y] - fringe_history[i+1][x][y]) for y in range(3)] 
-                             for x in range(3)] for i in range(len(fringe_history)-1)]
-                    final_cost, steps = self.get_output(states)
-                    if search_trace:
-                        trace_buffer.append(f"Solution Found at depth {len(steps)} with cost of {final_cost}.")
-                    return trace_buffer,steps, final_cost
-             
-            depth += 1  
-            
-        return None, None, None 
+            Forgetting the worst leaves until the nodes fit in memory again.
+            '''
+            while memory > node_limit and worst_fringe:
+                f, _, _, leaf = heapq.heappop(worst_fringe)
+                if not leaf.in_open or not leaf.alive or -f != leaf.f or leaf.children or leaf.parent is None:
+                    continue
+                forget(leaf)
+                memory -= 1
+            self.max_fringe_size = memory if self.max_fringe_size < memory else self.max_fringe_size
+
+        return self.finish_trace(trace, None, None)
         
+'''
+Reading a start or goal file into the list of rows of the board, leaving out
+the END OF FILE line.
+'''
+def read_puzzle_file(path):
+    with open(path, 'r') as f:
+        lines = [line.strip().split() for line in f.readlines() if not "END" in line]
+        return [list(map(int, line)) for line in lines if line]
+
+CHECKPOINT_METHODS = ("bfs", "dfs", "ucs", "greedy", "a*", "a_star", "a*-pdb")
+
+'''
+Calling the search method with the given command line name on a puzzle, and
+returning the trace file name, the steps and the cost it found. The depth
+limit of dls is given as dls:<limit> or as depth_limit, the tables of the
+pattern database and table methods are kept in cache_dir, or only in memory
+when it is None, and early_goal_test makes bfs and dfs test the goal when a
+state is generated. A Search_Checkpoint given as checkpoint is saved to and
+resumed from by bfs, dfs, ucs, greedy, a* and a*-pdb.
+'''
+def run_method(puzzle, algorithm, search_trace=False, depth_limit=None, cache_dir='pdb_cache', early_goal_test=False,
+               checkpoint=None):
+    if checkpoint and algorithm not in CHECKPOINT_METHODS:
+        raise ValueError(f"Checkpoints are only supported by {', '.join(CHECKPOINT_METHODS)}")
+    if algorithm == "bfs":
+        return puzzle.bfs(search_trace, early_goal_test, checkpoint)
+    elif algorithm == "ucs":
+        return puzzle.ucs(search_trace, checkpoint)
+    elif algorithm == "bfs-bi":
+        return puzzle.bidirectional_bfs(search_trace)
+    elif algorithm == "ucs-bi":
+        return puzzle.bidirectional_ucs(search_trace)
+    elif algorithm == "dfs":
+        return puzzle.dfs(search_trace, early_goal_test, checkpoint)
+    elif algorithm.startswith("dls"):
+        limit = int(algorithm.split(":")[1]) if ":" in algorithm else depth_limit
+        if limit is None:
+            raise ValueError("dls needs a depth limit")
+        return puzzle.dls(limit, search_trace)
+    elif algorithm == "ids":
+        return puzzle.ids(search_trace)
+    elif algorithm == "greedy":
+        return puzzle.greedy(search_trace, checkpoint)
+    elif algorithm == "table":
+        return puzzle.table_solve(search_trace, cache_dir)
+    elif algorithm == "ida*":
+        return puzzle.ida_star(search_trace)
+    elif algorithm == "ida*-pdb":
+        puzzle.use_pattern_databases(cache_dir=cache_dir)
+        return puzzle.ida_star(search_trace)
+    elif algorithm.startswith("sma*"):
+        node_limit = int(algorithm.split(":")[1]) if ":" in algorithm else 100000
+        return puzzle.sma_star(node_limit, search_trace)
+    elif algorithm == "a*-pdb":
+        puzzle.use_pattern_databases(cache_dir=cache_dir)
+        return puzzle.a_star(search_trace, checkpoint)
+    elif algorithm in ("a*", "a_star"):
+        return puzzle.a_star(search_trace, checkpoint)
+    raise ValueError(f"Unknown search method {algorithm}")
+
+
+class Result:
+
+    '''
+    What solve returns: the status, which is solved, not_found, unsolvable or
+    limit, the steps and cost of the solution when there is one, the counters
+    of the search and the seconds it took.
+    '''
+    def __init__(self, method, status, steps=None, cost=None, puzzle=None, seconds=0.0, trace_filename=""):
+        self.method = method
+        self.status = status
+        self.steps = steps
+        self.cost = cost
+        self.depth = len(steps) if steps is not None else None
+        self.nodes_popped = puzzle.nodes_popped if puzzle else 0
+        self.nodes_expanded = puzzle.nodes_expanded if puzzle else 0
+        self.nodes_generated = puzzle.nodes_generated if puzzle else 0
+        self.max_fringe_size = puzzle.max_fringe_size if puzzle else 0
+        self.seconds = seconds
+        self.trace_filename = trace_filename
+
+    @property
+    def solved(self):
+        return self.status == "solved"
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def __repr__(self):
+        return f"Result(method={self.method!r}, status={self.status!r}, cost={self.cost}, depth={self.depth})"
+
+'''
+Solving one puzzle from Python without touching the disk. start and goal are
+boards given as lists of rows of any N x N size, method is one of the command
+line method names, and the search stops with the status limit once it pops
+more than max_nodes nodes or runs for more than max_seconds. No file is read
+or written unless cache_dir is given for the tables of a*-pdb, ida*-pdb and
+table, or search_trace asks for a trace. The tables are kept in the process
+either way, so a long running caller pays for them once per goal. With a
+Search_Checkpoint the search resumes from its file when there is one, saves
+to it as it goes, and removes it once the search has finished.
+'''
+def solve(start, goal, method="a*", max_nodes=None, max_seconds=None, depth_limit=None,
+          early_goal_test=False, cache_dir=None, search_trace=False, checkpoint=None):
+    started = time.perf_counter()
+    puzzle = Expense_Puzzle(start, goal)
+    if not puzzle.solvable:
+        return Result(method, "unsolvable", puzzle=puzzle, seconds=time.perf_counter() - started)
+    puzzle.set_limits(max_nodes, max_seconds)
+    try:
+        trace_filename, steps, cost = run_method(puzzle, method, search_trace, depth_limit, cache_dir, early_goal_test,
+                                                 checkpoint)
+    except Search_Limit_Reached:
+        return Result(method, "limit", puzzle=puzzle, seconds=time.perf_counter() - started)
+    if checkpoint:
+        checkpoint.discard()
+    status = "solved" if steps is not None else "not_found"
+    return Result(method, status, steps, cost, puzzle, time.perf_counter() - started, trace_filename)
+
+'''
+Collecting the start and goal file pairs of a batch. The source is either a
+manifest with a start file and a goal file on every line, relative to the
+manifest, or a directory where every file with start in its name is paired
+with the same name with goal in place of start. In both cases goal_file is
+used for starts that do not name their own goal.
+'''
+def batch_tasks(source, goal_file=None):
+    pairs = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if "start" not in name:
+                continue
+            paired = os.path.join(source, name.replace("start", "goal"))
+            pairs.append((os.path.join(source, name), paired if os.path.exists(paired) else goal_file))
+    else:
+        base = os.path.dirname(source)
+        with open(source, 'r') as f:
+            for line in f:
+                fields = line.split()
+                if not fields or fields[0].startswith("#"):
+                    continue
+                pairs.append((os.path.join(base, fields[0]), os.path.join(base, fields[1]) if len(fields) > 1 else goal_file))
+    for start_path, goal_path in pairs:
+        if goal_path is None:
+            raise ValueError(f"No goal file for {start_path}, give one with --goal")
+    return pairs
+
+'''
+The settings of the batch in a worker process, set once by its initializer.
+'''
+batch_settings = {}
+
+'''
+Loading the tables the method shares between instances for every goal of the
+batch. The parent builds and saves them first so the workers only have to
+map the files, and a worker keeps them for all of the instances it solves.
+'''
+def batch_load_tables(method, goal_paths):
+    for goal_path in goal_paths:
+        goal = read_puzzle_file(goal_path)
+        puzzle = Expense_Puzzle(goal, goal)
+        if method == "table":
+            Solution_Table.for_goal(puzzle)
+        elif method in ("a*-pdb", "ida*-pdb"):
+            puzzle.use_pattern_databases()
+
+def batch_worker_init(settings, goal_paths):
+    batch_settings.update(settings)
+    batch_load_tables(settings['method'], goal_paths)
+
+'''
+Solving one instance of the batch within the node and time limits, and
+returning its result as a record for the JSONL output.
+'''
+def batch_solve_task(task):
+    index, start_path, goal_path = task
+    record = {'index': index, 'start': start_path, 'goal': goal_path}
+    started = time.perf_counter()
+    try:
+        result = solve(read_puzzle_file(start_path), read_puzzle_file(goal_path), batch_settings['method'],
+                       batch_settings['max_nodes'], batch_settings['max_seconds'], batch_settings['depth_limit'],
+                       cache_dir='pdb_cache')
+        record.update(result.as_dict())
+        del record['trace_filename']
+    except Exception as error:
+        record.update(method=batch_settings['method'], status="error", error=f"{type(error).__name__}: {error}",
+                      seconds=time.perf_counter() - started)
+    record['seconds'] = round(record['seconds'], 6)
+    return record
+
+'''
+Solving every start and goal pair of a batch across a pool of processes and
+streaming one JSON line per instance to output, or to stdout, as soon as it
+is done. The lines come in the order the instances finish, their index
+gives the order of the manifest.
+'''
+def batch_solve(source, method, goal_file=None, workers=None, max_nodes=None, max_seconds=None,
+                depth_limit=None, output=None):
+    tasks = [(index, start_path, goal_path) for index, (start_path, goal_path) in enumerate(batch_tasks(source, goal_file))]
+    goal_paths = sorted({goal_path for _, _, goal_path in tasks})
+    settings = {'method': method, 'max_nodes': max_nodes, 'max_seconds': max_seconds, 'depth_limit': depth_limit}
+    batch_load_tables(method, goal_paths)
+
+    out = open(output, 'w') if output else sys.stdout
+    try:
+        with multiprocessing.Pool(workers, initializer=batch_worker_init, initargs=(settings, goal_paths)) as pool:
+            for record in pool.imap_unordered(batch_solve_task, tasks):
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+    finally:
+        if output:
+            out.close()
+
+def batch_main(arguments):
+    parser = argparse.ArgumentParser(prog="expense_8_puzzle.py batch",
+                                     description="Solve many start/goal pairs across a process pool, writing JSONL results.")
+    parser.add_argument("source", help="manifest of '<start-file> [<goal-file>]' lines, or a directory of *start* files")
+    parser.add_argument("method", nargs="?", default="a*", help="search method, as for a single run (default a*)")
+    parser.add_argument("--goal", help="goal file for the starts that do not name one")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--node-limit", type=int, default=None, help="most nodes popped per instance")
+    parser.add_argument("--time-limit", type=float, default=None, help="most seconds per instance")
+    parser.add_argument("--depth-limit", type=int, default=None, help="depth limit for dls")
+    parser.add_argument("--output", help="JSONL file to write (default: stdout)")
+    options = parser.parse_args(arguments)
+    if options.method == "dls" and options.depth_limit is None:
+        parser.error("dls needs --depth-limit or dls:<limit>")
+    batch_solve(options.source, options.method, options.goal, options.workers, options.node_limit,
+                options.time_limit, options.depth_limit, options.output)
+
+
 if __name__ == "__main__":
+
+    '''
+    Solving a whole batch of instances when the first argument is batch.
+    '''
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        batch_main(sys.argv[2:])
+        sys.exit(0)
+    
+    '''
+    Taking the checkpoint options out of the arguments. With --checkpoint the
+    search saves its progress to the file every --checkpoint-every seconds,
+    60 by default, and resumes from it when it is started again.
+    '''
+    checkpoint = None
+    checkpoint_every = 60
+    if "--checkpoint-every" in sys.argv:
+        index = sys.argv.index("--checkpoint-every")
+        checkpoint_every = float(sys.argv[index + 1])
+        del sys.argv[index:index + 2]
+    if "--checkpoint" in sys.argv:
+        index = sys.argv.index("--checkpoint")
+        checkpoint = Search_Checkpoint(sys.argv[index + 1], checkpoint_every)
+        del sys.argv[index:index + 2]
     
     '''
     Setting up the variables based on command line arguments and checking what
@@ -620,8 +1831,9 @@ if __name__ == "__main__":
     dump_flag = "false"
     start_file, goal_file = sys.argv[1],sys.argv[2]
     
+    dump_flags = ["true", "false"] + list(Search_Trace.FORMATS)
     if len(sys.argv) > 3:
-       if sys.argv[3] == "true" or sys.argv[3] == "false":
+       if sys.argv[3].lower().split(":")[0] in dump_flags:
            dump_flag = sys.argv[3]
        else:
             algorithm = sys.argv[3]
@@ -630,77 +1842,58 @@ if __name__ == "__main__":
         dump_flag = sys.argv[4]
     
     '''
-    Checking if search trace should be dumped or not.
+    Checking if search trace should be dumped or not. Other than true, the
+    flag can name the trace format, text, jsonl or binary, optionally followed
+    by :<n> to only write the events of every n-th pop.
     '''
     dump_flag = dump_flag.lower()
-    if dump_flag == "true":
-        search_trace = True
+    trace_format, _, trace_sample = dump_flag.partition(":")
+    if trace_format == "true":
+        search_trace = Search_Trace(sample=int(trace_sample or 1))
+    elif trace_format in Search_Trace.FORMATS:
+        search_trace = Search_Trace(trace_format, sample=int(trace_sample or 1))
     else:
         search_trace = False
     
     '''
     Opening the start and goal file to pass it along to the class object.
     '''
-    with open(start_file, 'r') as f:
-        lines = [line.strip().split() for line in f.readlines() if not "END" in line]
-        puzzle_start = [list(map(int, line)) for line in lines]
-
-    with open(goal_file, 'r') as f:
-        lines = [line.strip().split() for line in f.readlines() if not "END" in line]
-        puzzle_goal = [list(map(int, line)) for line in lines]
+    puzzle_start = read_puzzle_file(start_file)
+    puzzle_goal = read_puzzle_file(goal_file)
+    try:
+        puzzle = Expense_Puzzle(puzzle_start, puzzle_goal)
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
     
-    puzzle = Expense_Puzzle(puzzle_start, puzzle_goal)
+    '''
+    Answering at once when the goal cannot be reached from the start.
+    '''
+    if not puzzle.solvable:
+        print("Solution Not Found: the start and goal boards have opposite parity, so no moves lead from one to the other.")
+        sys.exit(0)
     
     
     '''
     Based on what algorithm/method was used, the correct function will be called
     with the correct parameters.
     '''
-    if algorithm == "bfs":
-        trace_filename, steps, cost = puzzle.bfs(search_trace)
-    
-    elif algorithm == "ucs":
-        trace_filename, steps, cost = puzzle.ucs(search_trace)
-   
-    elif algorithm == "dfs":
-        trace_buffer, steps, cost = puzzle.dfs(search_trace)
-        if search_trace:
-            time = datetime.datetime.now()
-            file_time = time.strftime('%Y%m%d-%H%M%S')
-            trace_filename = f"trace-{file_time}.txt"
-            with open(trace_filename, "a") as f:
-                for line in trace_buffer:
-                    f.write(line)
-    
-    elif algorithm == "dls":
+    depth_limit = None
+    if algorithm == "dls":
         user_input = input("Please enter the Depth Limit: ")
         while not user_input.isdigit():
             print("\nInput has to be a Number.. Try again\n\n")
             user_input = input("Please enter the Depth Limit: ")
-        limit = int(user_input)
-        trace_buffer, steps, cost = puzzle.dls(limit,search_trace)
-        if search_trace:
-            time = datetime.datetime.now()
-            file_time = time.strftime('%Y%m%d-%H%M%S')
-            trace_filename = f"trace-{file_time}.txt"
-            with open(trace_filename, "a") as trace_file:
-                for line in trace_buffer:
-                    trace_file.write(line)
-    
-    elif algorithm == "ids":
-        trace_buffer, steps, cost = puzzle.ids(search_trace)
-        if search_trace:
-            time = datetime.datetime.now()
-            file_time = time.strftime('%Y%m%d-%H%M%S')
-            trace_filename = f"trace-{file_time}.txt"
-            with open(trace_filename, "a") as trace_file:
-                for line in trace_buffer:
-                    trace_file.write(line)
-        
-    elif algorithm == "greedy":
-        trace_filename, steps, cost = puzzle.greedy(search_trace)
-    else:
-        trace_filename, steps, cost = puzzle.a_star(search_trace)
+        depth_limit = int(user_input)
+    try:
+        if checkpoint and checkpoint.exists():
+            print(f"Resuming the search from {checkpoint.path}")
+        trace_filename, steps, cost = run_method(puzzle, algorithm, search_trace, depth_limit, checkpoint=checkpoint)
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
+    if checkpoint:
+        checkpoint.discard()
     
     '''
     Based on if solution is found the output will be printed.
@@ -717,18 +1910,3 @@ if __name__ == "__main__":
         for step in steps:
             print(f"\t{step}")
 
-    '''
-    Adding the final output to the search trace dump file
-    '''
-    if search_trace:
-        with open(trace_filename, "a") as trace_file:
-            if steps == None and cost == None:
-                trace_file.write("Solution Not Found")     
-            else:
-                trace_file.write("\n\n\nFinal Output\n\n")
-                trace_file.write(f"Nodes Popped: {puzzle.nodes_popped}\n")
-                trace_file.write(f"Nodes Expanded: {puzzle.nodes_expanded}\n")
-                trace_file.write(f"Nodes Generated: {puzzle.nodes_generated}\n")
-                trace_file.write(f"Max Fringe Size: {puzzle.max_fringe_size}\n")
-                trace_file.write(f"Solution Found at depth {len(steps)} with cost of {cost}.\n")
-                
\ No newline at end of file
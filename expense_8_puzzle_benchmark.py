@@ -0,0 +1,294 @@
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import multiprocessing
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from expense_8_puzzle import Expense_Puzzle, Solution_Table, Search_Limit_Reached, run_method
+
+
+'''
+The benchmark for the search methods of the Expense 8 Puzzle. A fixed corpus
+of start states is drawn with a seed from the boards of the solution table,
+graded into tiers by their optimal cost, and every method is run on every
+start in a fresh process under a time, node and memory budget. The results,
+with the node counts, nodes per second, peak memory and cost of every run,
+are written as JSON and can be compared with a stored baseline so drops in
+the throughput of the hot paths are caught.
+'''
+
+GOAL = [[1, 2, 3], [4, 5, 6], [7, 8, 0]]
+
+'''
+The tiers of the corpus, by the inclusive range of the optimal cost.
+'''
+TIERS = [("trivial", 1, 20), ("easy", 21, 50), ("medium", 51, 80), ("hard", 81, 110), ("hardest", 111, 0xFFFE)]
+
+'''
+Fixed starts that once came back from a method with the wrong cost, run on
+top of the drawn corpus every time. The first one made a*-pdb return 92
+instead of 86 while its pattern databases were not consistent.
+'''
+REGRESSION_STARTS = [("regression-0", [[5, 1, 4], [3, 6, 2], [7, 8, 0]])]
+
+METHODS = ["bfs", "ucs", "dfs", "dls", "ids", "greedy", "a*", "bfs-bi", "ucs-bi", "ida*", "ida*-pdb",
+           "a*-pdb", "sma*", "table"]
+
+'''
+The methods that always find the cheapest solution, whose cost has to match
+the optimal cost of the corpus.
+'''
+OPTIMAL_METHODS = {"ucs", "ucs-bi", "a*", "ida*", "ida*-pdb", "a*-pdb", "sma*", "table"}
+
+
+'''
+The inverse of the Lehmer rank of the solution table, giving back the tile on
+every cell of the board with the given rank.
+'''
+def unrank(index, cells):
+    digits = []
+    for radix in range(1, cells + 1):
+        digits.append(index % radix)
+        index //= radix
+    remaining = list(range(cells))
+    return [remaining.pop(digit) for digit in reversed(digits)]
+
+'''
+Drawing per_tier start states for every tier, uniformly among all the boards
+whose optimal cost falls in the tier. The solution table gives the optimal
+cost of every board, and the length of its walk is the depth used by dls.
+The regression starts are added after the drawn ones.
+'''
+def build_corpus(seed, per_tier, cache_dir='pdb_cache'):
+    goal_puzzle = Expense_Puzzle(GOAL, GOAL)
+    table = Solution_Table.for_goal(goal_puzzle, cache_dir)
+    cells = goal_puzzle.size * goal_puzzle.size
+    generator = random.Random(seed)
+    corpus = []
+    for tier, low, high in TIERS:
+        ranks = [index for index, cost in enumerate(table.costs) if low <= cost <= high]
+        for number, index in enumerate(sorted(generator.sample(ranks, per_tier))):
+            tiles = unrank(index, cells)
+            start = [tiles[row * goal_puzzle.size:(row + 1) * goal_puzzle.size] for row in range(goal_puzzle.size)]
+            puzzle = Expense_Puzzle(start, GOAL)
+            corpus.append({'id': f"{tier}-{number}", 'tier': tier, 'start': start,
+                           'optimal_cost': table.costs[index], 'optimal_depth': len(table.walk(puzzle))})
+    for name, start in REGRESSION_STARTS:
+        puzzle = Expense_Puzzle(start, GOAL)
+        tiles = [tile for row in start for tile in row]
+        corpus.append({'id': name, 'tier': "regression", 'start': start,
+                       'optimal_cost': table.costs[table.rank(tiles)], 'optimal_depth': len(table.walk(puzzle))})
+    return corpus
+
+'''
+Capping the address space of a benchmark process, so a method that runs out
+of memory fails with a MemoryError instead of taking the machine down.
+'''
+def limit_memory(memory_limit_mb):
+    if resource and memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def peak_rss_kb():
+    if not resource:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+'''
+Timing one method on one start of the corpus. The tables a method shares
+between instances are loaded before the clock starts, so only the search
+itself is timed.
+'''
+def time_method(instance, method, time_limit, node_limit):
+    puzzle = Expense_Puzzle(instance['start'], GOAL)
+    if method in ("a*-pdb", "ida*-pdb"):
+        puzzle.use_pattern_databases()
+    elif method == "table":
+        Solution_Table.for_goal(puzzle)
+    puzzle.set_limits(node_limit, time_limit)
+    cost = steps = None
+    started = time.perf_counter()
+    try:
+        _, steps, cost = run_method(puzzle, method, False, instance['optimal_depth'])
+        status = "solved" if steps is not None else "not_found"
+    except Search_Limit_Reached:
+        status = "limit"
+    except MemoryError:
+        status = "memory"
+    return puzzle, status, steps, cost, time.perf_counter() - started
+
+'''
+Running one method on one start of the corpus repeat times and keeping the
+fastest run, which is the least disturbed by the rest of the machine. The
+methods are deterministic, so every run has the same counts, and a run
+that hits a limit is not repeated.
+'''
+def benchmark_run(task):
+    instance, method, time_limit, node_limit, repeat = task
+    record = {'id': instance['id'], 'tier': instance['tier'], 'method': method}
+    puzzle, status, steps, cost, seconds = time_method(instance, method, time_limit, node_limit)
+    for _ in range(repeat - 1):
+        if status not in ("solved", "not_found"):
+            break
+        seconds = min(seconds, time_method(instance, method, time_limit, node_limit)[4])
+    record['status'] = status
+    record['cost'] = cost
+    record['depth'] = len(steps) if steps is not None else None
+    for counter in ('nodes_popped', 'nodes_expanded', 'nodes_generated', 'max_fringe_size'):
+        record[counter] = getattr(puzzle, counter)
+    record['seconds'] = round(seconds, 6)
+    record['nodes_per_second'] = round(puzzle.nodes_expanded / seconds) if seconds > 0 else None
+    record['peak_rss_kb'] = peak_rss_kb()
+    return record
+
+'''
+Running every method on every start, one run at a time so the runs do not
+compete for the CPU, each in a new process so the peak memory of a run is
+its own.
+'''
+def run_benchmark(corpus, methods, time_limit, node_limit, memory_limit_mb, repeat):
+    tasks = [(instance, method, time_limit, node_limit, repeat) for method in methods for instance in corpus]
+    context = multiprocessing.get_context("spawn")
+    results = []
+    with context.Pool(1, initializer=limit_memory, initargs=(memory_limit_mb,), maxtasksperchild=1) as pool:
+        for record in pool.imap(benchmark_run, tasks):
+            print(f"{record['method']:>9} {record['id']:<10} {record['status']:<9} "
+                  f"{record['nodes_expanded']:>10} nodes {record['seconds']:>10.4f}s", file=sys.stderr)
+            results.append(record)
+    return results
+
+'''
+The totals of every method over the corpus. The nodes per second of a method
+is its expanded nodes over its seconds across all the runs, which is steadier
+than the rate of any one short run.
+'''
+def summarize(corpus, results):
+    optimal_cost = {instance['id']: instance['optimal_cost'] for instance in corpus}
+    summary = {}
+    for record in results:
+        totals = summary.setdefault(record['method'], {'runs': 0, 'solved': 0, 'optimal': 0, 'nodes_expanded': 0,
+                                                       'nodes_generated': 0, 'seconds': 0.0, 'peak_rss_kb': 0})
+        totals['runs'] += 1
+        totals['solved'] += record['status'] == "solved"
+        totals['optimal'] += record['cost'] == optimal_cost[record['id']]
+        totals['nodes_expanded'] += record['nodes_expanded']
+        totals['nodes_generated'] += record['nodes_generated']
+        totals['seconds'] += record['seconds']
+        totals['peak_rss_kb'] = max(totals['peak_rss_kb'], record['peak_rss_kb'] or 0)
+    for totals in summary.values():
+        totals['seconds'] = round(totals['seconds'], 6)
+        totals['nodes_per_second'] = round(totals['nodes_expanded'] / totals['seconds']) if totals['seconds'] else None
+    return summary
+
+'''
+The runs of the methods that always find the cheapest solution which came
+back with another cost, as regressions.
+'''
+def check_optimal(corpus, results):
+    optimal_cost = {instance['id']: instance['optimal_cost'] for instance in corpus}
+    return [f"{record['method']} found cost {record['cost']} on {record['id']}, the optimum is {optimal_cost[record['id']]}"
+            for record in results
+            if record['method'] in OPTIMAL_METHODS and record['status'] == "solved"
+            and record['cost'] != optimal_cost[record['id']]]
+
+'''
+Comparing a report with a baseline report and returning the regressions,
+which fail the run, and the changes, which are only shown. A method is
+slower when its nodes per second dropped by more than tolerance, which is
+only judged for methods that ran for at least min_seconds in both reports,
+since the rate of a method done in a few milliseconds is mostly noise. A run
+regressed when it no longer solves its start or finds a costlier solution.
+Node counts that changed at all are listed as changes, since the methods are
+deterministic and a different count means the search itself changed. Both
+reports have to be of the same corpus, as a start id names another board
+under another seed or number of starts per tier.
+'''
+def compare(report, baseline, tolerance, min_seconds):
+    regressions, changes = [], []
+    for method, totals in report['summary'].items():
+        old = baseline['summary'].get(method)
+        if not old or not old['nodes_per_second'] or not totals['nodes_per_second']:
+            continue
+        if min(old['seconds'], totals['seconds']) < min_seconds:
+            continue
+        ratio = totals['nodes_per_second'] / old['nodes_per_second']
+        line = f"{method}: {old['nodes_per_second']} -> {totals['nodes_per_second']} nodes/s ({ratio - 1:+.1%})"
+        if ratio < 1 - tolerance:
+            regressions.append(line)
+        elif ratio > 1 + tolerance:
+            changes.append(line)
+    old_results = {(record['id'], record['method']): record for record in baseline['results']}
+    for record in report['results']:
+        old = old_results.get((record['id'], record['method']))
+        if not old:
+            continue
+        name = f"{record['method']} on {record['id']}"
+        if old['status'] == "solved" and record['status'] != "solved":
+            regressions.append(f"{name}: {record['status']}, was solved")
+        elif old['cost'] is not None and record['cost'] is not None and record['cost'] > old['cost']:
+            regressions.append(f"{name}: cost {old['cost']} -> {record['cost']}")
+        elif record['status'] == old['status'] == "solved" and record['nodes_expanded'] != old['nodes_expanded']:
+            changes.append(f"{name}: expanded {old['nodes_expanded']} -> {record['nodes_expanded']}")
+    return regressions, changes
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description="Benchmark the Expense 8 Puzzle search methods on a seeded corpus.")
+    parser.add_argument("--seed", type=int, default=8, help="seed of the corpus (default 8)")
+    parser.add_argument("--per-tier", type=int, default=2, help="starts drawn per cost tier (default 2)")
+    parser.add_argument("--methods", default=",".join(METHODS), help="comma separated methods to run (default all)")
+    parser.add_argument("--time-limit", type=float, default=5.0, help="seconds per run (default 5)")
+    parser.add_argument("--node-limit", type=int, default=None, help="nodes popped per run")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of every method on every start, the fastest is kept (default 3)")
+    parser.add_argument("--memory-limit", type=int, default=2048, help="MB of address space per run (default 2048)")
+    parser.add_argument("--output", help="JSON report to write (default: stdout)")
+    parser.add_argument("--baseline", help="JSON report to compare with; regressions make the exit status 1")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="fraction the nodes per second of a method may drop before it counts (default 0.2)")
+    parser.add_argument("--min-seconds", type=float, default=0.5,
+                        help="seconds a method has to run in total before its nodes per second are compared (default 0.5)")
+    options = parser.parse_args(arguments)
+
+    baseline = None
+    if options.baseline:
+        with open(options.baseline, 'r') as f:
+            baseline = json.load(f)
+        if (baseline['seed'], baseline['per_tier']) != (options.seed, options.per_tier):
+            parser.error(f"the baseline was recorded with --seed {baseline['seed']} --per-tier {baseline['per_tier']}, "
+                         f"run with the same to compare")
+
+    corpus = build_corpus(options.seed, options.per_tier)
+    results = run_benchmark(corpus, options.methods.split(","), options.time_limit, options.node_limit,
+                            options.memory_limit, options.repeat)
+    report = {'seed': options.seed, 'per_tier': options.per_tier, 'time_limit': options.time_limit,
+              'node_limit': options.node_limit, 'repeat': options.repeat, 'memory_limit_mb': options.memory_limit,
+              'python': platform.python_version(), 'machine': platform.machine(),
+              'corpus': corpus, 'results': results, 'summary': summarize(corpus, results)}
+
+    text = json.dumps(report, indent=2) + "\n"
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+    regressions = check_optimal(corpus, results)
+    if baseline:
+        more, changes = compare(report, baseline, options.tolerance, options.min_seconds)
+        regressions += more
+        for line in changes:
+            print(f"changed: {line}", file=sys.stderr)
+    for line in regressions:
+        print(f"REGRESSION: {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))